@@ -0,0 +1,287 @@
+import os
+# Benchmarks run without a real window or audio device
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from main import (
+    AIKart, DEFAULT_TRACK, Game, GameState, INPUT_RIGHT, INPUT_UP, Kart, PARTICLE_CAPACITY, PARTICLE_KINDS,
+    ParticleSystem, RaceSimulation, SCREEN_HEIGHT, SCREEN_WIDTH, SIM_DT, TelemetryRecorder, Track, load_track,
+)
+from race_env import VecRaceEnv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Fresh interpreter per run: import, open the window, show the menu (and optionally the first race frame)
+STARTUP_PROBE = """
+import sys
+sys.path.insert(0, {root!r})
+import pygame
+from main import Game, SIM_DT
+game = Game()
+game.draw_menu()
+pygame.display.flip()
+if {race}:
+    game.reset_game()
+    game.play_frame(pygame.key.get_pressed(), SIM_DT)
+    pygame.display.flip()
+"""
+STARTUP_RUNS = 10  # process launches are slow; cap the iteration count
+BAKE_RUNS = 10  # same for uncached track bakes
+
+class HeldKeys:
+    # Stand-in for pygame.key.get_pressed(): accelerate and steer right
+    def __init__(self, held=(pygame.K_UP, pygame.K_RIGHT)):
+        self.held = set(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+    def __len__(self):
+        return 1
+
+def densify(centerline, factor):
+    # Linearly subdivide every centerline segment into `factor` pieces
+    if factor <= 1:
+        return list(centerline)
+    out = []
+    n = len(centerline)
+    for i in range(n):
+        x1, y1 = centerline[i]
+        x2, y2 = centerline[(i + 1) % n]
+        for j in range(factor):
+            t = j / factor
+            out.append((x1 + (x2 - x1) * t, y1 + (y2 - y1) * t))
+    return out
+
+def make_track(density):
+    base = load_track(DEFAULT_TRACK)
+    if density == 1:
+        return base
+    return Track({'centerline': densify(base.centerline, density)})
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def measure(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    total = sum(samples)
+    return {
+        'iterations': iterations,
+        'per_sec': iterations / (total / 1e9) if total else 0.0,
+        'mean_ms': total / iterations / 1e6,
+        'p50_ms': percentile(samples, 50) / 1e6,
+        'p95_ms': percentile(samples, 95) / 1e6,
+        'p99_ms': percentile(samples, 99) / 1e6,
+        'max_ms': samples[-1] / 1e6,
+    }
+
+def bench_kart_update(track, karts, iterations, warmup):
+    kart = Kart(track.centerline[0][0], track.centerline[0][1], (220, 20, 60), is_player=True)
+    keys = HeldKeys()
+    return measure(lambda: kart.update(keys, track), iterations, warmup)
+
+def bench_ai_update(track, karts, iterations, warmup):
+    rng = random.Random(0)
+    lanes, row = RaceSimulation.grid_shape(track, karts)
+    field = [AIKart(*RaceSimulation.grid_slot(track, i, lanes, row)[:2], (30, 144, 255), track.centerline, rng=rng)
+             for i in range(karts)]
+    ai = field[0]
+    return measure(lambda: ai.update(None, track, field), iterations, warmup)
+
+def bench_is_on_road(track, karts, iterations, warmup):
+    rng = random.Random(0)
+    xs = [p[0] for p in track.outer_points]
+    ys = [p[1] for p in track.outer_points]
+    points = [(rng.uniform(min(xs), max(xs)), rng.uniform(min(ys), max(ys))) for _ in range(1024)]
+    state = {'i': 0}
+    def query():
+        x, y = points[state['i'] & 1023]
+        state['i'] += 1
+        track.is_on_road(x, y)
+    return measure(query, iterations, warmup)
+
+def bench_track_draw(track, karts, iterations, warmup):
+    screen = pygame.display.get_surface()
+    state = {'i': 0}
+    def draw():
+        # Orbit the centerline so tiles and culling are exercised
+        x, y = track.centerline[state['i'] % len(track.centerline)]
+        state['i'] += 1
+        track.draw(screen, int(x - SCREEN_WIDTH // 2), int(y - SCREEN_HEIGHT // 2))
+    return measure(draw, iterations, warmup)
+
+def bench_track_bake(track, karts, iterations, warmup):
+    # Uncached bake of the same layout: edges, arrays, surface raster, racing line, tiles
+    layout = {'centerline': track.centerline}
+    def bake():
+        Track(layout).build_tiles()
+    return measure(bake, min(iterations, BAKE_RUNS), min(warmup, 1))
+
+def bench_sim_step(track, karts, iterations, warmup):
+    sim = RaceSimulation(track, num_ai=karts, with_player=False, seed=0)
+    return measure(sim.step, iterations, warmup)
+
+def bench_player_race(ai_lod):
+    # Step with a player kart parked on the grid, so most of the field is outside its view
+    def run(track, karts, iterations, warmup):
+        sim = RaceSimulation(track, num_ai=karts, seed=0, ai_lod=ai_lod)
+        for _ in range(300):
+            sim.step()
+        return measure(sim.step, iterations, warmup)
+    return run
+
+def bench_sim_step_telemetry(track, karts, iterations, warmup):
+    # sim_step with telemetry on; the writer thread's file goes to the null device
+    sim = RaceSimulation(track, num_ai=karts, with_player=False, seed=0)
+    sim.telemetry = TelemetryRecorder(os.devnull, sim)
+    stats = measure(sim.step, iterations, warmup)
+    sim.telemetry.close()
+    return stats
+
+def bench_collide(track, karts, iterations, warmup):
+    # Collision pass alone, on a field that has spread out from the grid
+    sim = RaceSimulation(track, num_ai=karts, with_player=False, seed=0)
+    for _ in range(120):
+        sim.step()
+    return measure(sim.fleet.collide, iterations, warmup)
+
+def bench_update_positions(track, karts, iterations, warmup):
+    sim = RaceSimulation(track, num_ai=karts, with_player=False, seed=0)
+    for _ in range(120):
+        sim.step()
+    return measure(sim.update_positions, iterations, warmup)
+
+def bench_game_frame(track, karts, iterations, warmup):
+    game = Game()
+    game.track = track
+    game.num_ai = max(0, karts - 1)
+    game.reset_game()
+    game.state = GameState.PLAYING
+    keys = HeldKeys()
+    return measure(lambda: game.play_frame(keys, SIM_DT), iterations, warmup)
+
+def bench_particles(track, karts, iterations, warmup):
+    # One tick of a nearly full pool: update plus draw, topped up to replace what expired
+    screen = pygame.display.get_surface()
+    particles = ParticleSystem(seed=0)
+    kinds = list(PARTICLE_KINDS)
+    def tick():
+        for kind in kinds:
+            particles.emit(kind, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2, PARTICLE_CAPACITY, radius=SCREEN_HEIGHT / 2)
+        particles.update()
+        particles.draw(screen)
+    return measure(tick, iterations, warmup)
+
+def bench_vec_env(track, karts, iterations, warmup):
+    # One vector step of `karts` independent races (the per_sec figure is vector steps, not env steps)
+    env = VecRaceEnv(track, karts)
+    env.reset()
+    actions = np.full(karts, INPUT_UP | INPUT_RIGHT, dtype=np.uint8)
+    return measure(lambda: env.step(actions), iterations, warmup)
+
+def bench_startup(race):
+    def run(track, karts, iterations, warmup):
+        probe = STARTUP_PROBE.format(root=ROOT, race=race)
+        launch = lambda: subprocess.run([sys.executable, '-c', probe], check=True)
+        return measure(launch, min(iterations, STARTUP_RUNS), min(warmup, 1))
+    return run
+
+BENCHMARKS = {
+    'kart_update': bench_kart_update,
+    'ai_update': bench_ai_update,
+    'is_on_road': bench_is_on_road,
+    'track_draw': bench_track_draw,
+    'track_bake': bench_track_bake,
+    'sim_step': bench_sim_step,
+    'sim_step_telemetry': bench_sim_step_telemetry,
+    'sim_step_player': bench_player_race(False),
+    'sim_step_lod': bench_player_race(True),
+    'collide': bench_collide,
+    'update_positions': bench_update_positions,
+    'game_frame': bench_game_frame,
+    'particles': bench_particles,
+    'vec_env': bench_vec_env,
+    'startup_menu': bench_startup(False),
+    'startup_race': bench_startup(True),
+}
+
+# Benchmarks whose cost does not depend on the field size
+SINGLE_KART = {'kart_update', 'is_on_road', 'track_draw', 'track_bake', 'particles', 'startup_menu', 'startup_race'}
+# Benchmarks that always launch the default track, so one density is enough
+TRACK_INDEPENDENT = {'particles', 'startup_menu', 'startup_race'}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time simulation and rendering hot paths; prints JSON.")
+    parser.add_argument('--karts', default='4,50,200', help="comma-separated kart counts")
+    parser.add_argument('--density', default='1,8', help="comma-separated centerline subdivision factors")
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=30)
+    parser.add_argument('--only', help="comma-separated benchmark names to run")
+    parser.add_argument('--out', help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    kart_counts = [int(v) for v in args.karts.split(',')]
+    densities = [int(v) for v in args.density.split(',')]
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    results = []
+    for density in densities:
+        track = make_track(density)
+        for name in names:
+            if name in TRACK_INDEPENDENT and density != densities[0]:
+                continue
+            for karts in ([1] if name in SINGLE_KART else kart_counts):
+                stats = BENCHMARKS[name](track, karts, args.iterations, args.warmup)
+                stats.update({
+                    'name': name,
+                    'karts': karts,
+                    'density': density,
+                    'centerline_points': len(track.centerline),
+                })
+                results.append(stats)
+                print(f"{name:18s} karts={karts:<4d} pts={len(track.centerline):<5d} "
+                      f"{stats['per_sec']:10.1f}/s  p50={stats['p50_ms']:.3f}ms  p99={stats['p99_ms']:.3f}ms",
+                      file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
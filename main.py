@@ -1,15 +1,30 @@
 import pygame
+import argparse
+import hashlib
+import json
 import math
+import os
+import queue
 import random
+import shutil
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
 from enum import Enum
 
-# Initialize Pygame
-pygame.init()
+import numpy as np
 
 # Constants
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 800
 FPS = 60
+SIM_DT = 1.0 / FPS  # Physics advances a fixed amount per tick
+RENDER_FPS = 120  # Frame cap; the sim keeps its own fixed rate underneath
+MAX_FRAME_DT = 0.25  # Longer stalls are dropped instead of replayed as a burst of ticks
+LOAD_BUDGET = 0.004  # Seconds per menu frame spent warming race assets in the background
+TELEPORT_DIST = 60  # Karts that move further than this in one tick (respawns) are not interpolated
 
 # Palette & Colors
 WHITE = (255, 255, 255)
@@ -25,20 +40,999 @@ LAVA_MAIN = (207, 16, 32)
 LAVA_CORE = (255, 80, 0)
 UI_BG = (20, 20, 20)
 
+# Surface raster: one uint8 per cell, bit flags so a hazard can sit on road or grass
+SURFACE_CELL = 2  # px per raster cell
+SURFACE_GRASS = 0
+SURFACE_ROAD = 1
+SURFACE_WATER = 2
+SURFACE_LAVA = 4
+SURFACE_HAZARD = SURFACE_WATER | SURFACE_LAVA
+HAZARD_HIT_SCALE = 0.8  # Respawn once inside 80% of the drawn radius
+
+# AI perception
+AVOID_RADIUS = 70     # Karts closer than this push each other apart
+BRUTE_PAIRS = 4096    # query x point pairs up to which one distance matrix beats walking the hash cells
+
+# Kart-to-kart collisions
+KART_WIDTH = 30
+KART_HEIGHT = 40
+BUMP_RESTITUTION = 0.5  # share of the closing speed along the contact normal that bounces back
+
+# Starting grid
+GRID_ROW = 50  # px of track between rows
+GRID_LANE = 45  # px between lanes across the road
+GRID_ROWS = 8  # rows a field may fill before the grid gets another lane
+GRID_SPAN = 0.8  # share of a lap the grid may cover
+GRID_CLEARANCE = 44  # px kept between kart centres, so corners cannot squeeze two slots together
+
+# Racing line
+RACING_LINE_STEP = 10  # px of centerline arc between racing line samples
+LINE_TURN_SPEED = 4.5  # degrees per tick of turn_speed the speed profile is built for (the karts' default)
+RACING_LINE_ITERATIONS = 400  # relaxation passes when optimising the line
+RACING_LINE_MARGIN = 45  # px kept between the line and the road edge
+HAZARD_CLEARANCE = 30  # px kept between the line and a hazard's hit circle
+LINE_TURN_RATE = math.radians(LINE_TURN_SPEED) * 1.2  # yaw rate per tick the speed profile assumes (lookahead steering cuts corners)
+LINE_BRAKE = 0.16  # AI deceleration per tick (lift-off plus friction) used for the braking pass
+LINE_LOOKAHEAD = 60  # px ahead of the kart's line position to steer at...
+LINE_LOOKAHEAD_GAIN = 6  # ...plus this many px per unit of speed
+LANE_SCALE = 0.5  # share of an AI kart's lane_offset applied across the line
+
+# AI level of detail: AI karts outside every player's view search for their track position only
+# every LOD_INTERVAL ticks and dead-reckon it in between; steering, avoidance, hazards and
+# physics still run every tick. Reach is in view half-extents to the nearest player kart;
+# the gap between the two thresholds stops karts flickering between levels
+LOD_NEAR = 1.2  # back to full detail inside this reach
+LOD_FAR = 1.4  # reduced detail beyond this reach
+LOD_INTERVAL = 4  # ticks between kart avoidance queries (and collision checks) for far karts
+
+# Race progress
+SEGMENT_WINDOW = np.arange(-2, 5)  # fewest centerline segments searched around each kart's hint...
+HINT_REACH = 20  # ...widened on finely sampled tracks to cover this many px ahead (two ticks at top speed), half behind
+HINT_LOST_WIDTHS = 3  # further than this many track half-widths from the hinted segments: search them all
+HINT_JUMP = 25  # px; a kart's distance to its segment growing more than this in a tick also means a full search
+LEAF_SEGMENTS = 8  # segments per leaf of the track's bounding-volume hierarchy
+FINISHED_RANK = 1e15  # finished karts rank above any progress value
+
+# Track rendering
+TRACK_TILE = 256  # px per side of a pre-rendered track tile
+TILE_MARGIN = 16  # covers kerb/shoulder line widths spilling past the edge polygons
+# Track files
+# A PyInstaller bundle unpacks its data files (--add-data "tracks:tracks") under sys._MEIPASS
+DEFAULT_TRACK = os.path.join(getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__))), "tracks", "lava_loop.json")
+TRACK_CACHE_DIR = ".cache"  # created next to the track files
+TRACK_CACHE_VERSION = 4  # bump when the baked data layout or the bake itself changes
+SPRITE_ANGLE_STEP = 2  # degrees between pre-rotated kart/shadow frames
+TEXT_CACHE_SIZE = 256  # rendered strings kept before LRU eviction
+
+# Particles: fixed pool, advanced once per sim tick, drawn straight into the frame's pixels
+PARTICLE_CAPACITY = 32768
+PARTICLE_RAMP_STEPS = 32  # colours sampled along each ramp
+# kind: colour ramp (young -> old), lifetime ticks, launch speed px/tick, per-tick drift, drag, block size px
+PARTICLE_KINDS = {
+    'ember': {'colors': ((255, 230, 120), (255, 90, 0), (110, 20, 0)), 'life': (30, 70), 'speed': (0.2, 1.0),
+              'drift': (0.0, -0.04), 'drag': 0.97, 'size': 2},
+    'splash': {'colors': ((235, 245, 255), (120, 170, 255), (40, 90, 200)), 'life': (20, 40), 'speed': (1.5, 4.0),
+               'drift': (0.0, 0.0), 'drag': 0.92, 'size': 2},
+    'smoke': {'colors': ((190, 180, 160), (140, 135, 120), (100, 110, 90)), 'life': (25, 50), 'speed': (0.1, 0.6),
+              'drift': (0.0, 0.0), 'drag': 0.95, 'size': 3},
+    'burst': {'colors': ((255, 255, 255), (255, 230, 120), (180, 180, 180)), 'life': (25, 45), 'speed': (2.0, 5.0),
+              'drift': (0.0, 0.0), 'drag': 0.9, 'size': 2},
+}
+EMBERS_PER_TICK = 4  # per on-screen lava pool
+SPLASH_PER_TICK = 1  # ambient droplets per on-screen pond
+SMOKE_PER_TICK = 2  # per kart driving off-road
+HIT_PARTICLES = 80  # lava/water burst where a kart hits a hazard
+RESPAWN_PARTICLES = 50  # burst at the respawn point
+
+# Profiler
+PROFILER_HISTORY = 240  # frames shown in the overlay graph
+TRACE_MAX_FRAMES = 36000  # frames kept for trace export (10 minutes at 60 FPS)
+TRACE_FILE = "frame_trace.json"
+PHASE_COLORS = {
+    'input': (180, 180, 180),
+    'physics': (255, 80, 0),
+    'collisions': (255, 105, 180),
+    'hazards': (207, 16, 32),
+    'checkpoints': (255, 215, 0),
+    'positions': (255, 140, 0),
+    'telemetry': (0, 206, 209),
+    'track': (0, 180, 0),
+    'particles': (255, 170, 60),
+    'shadows': (90, 90, 90),
+    'karts': (30, 144, 255),
+    'hud': (128, 0, 128),
+    'overlay': (60, 60, 60),
+    'menu': (120, 120, 120),
+    'loading': (0, 128, 128),
+    'flip': (220, 220, 220),
+}
+
+# Quality governor: levels from best to cheapest, stepped by recent frame times.
+# Scales stay integer fractions so the upscale is a cheap nearest-neighbour blit.
+QUALITY_LEVELS = [
+    {'scale': 1, 'shadows': True, 'particles': True},
+    {'scale': 1, 'shadows': False, 'particles': True},
+    {'scale': 0.5, 'shadows': False, 'particles': False},
+]
+FRAME_BUDGET_MS = 1000.0 / FPS
+GOVERNOR_WINDOW = 30  # frames averaged per decision
+GOVERNOR_DROP = 0.9  # drop a level when the window's mean work time exceeds this share of the budget...
+GOVERNOR_RAISE = 0.5  # ...raise one back when it stays under this share
+GOVERNOR_RAISE_WINDOWS = 4  # consecutive calm windows needed before raising
+GOVERNOR_MIN_GAIN = 0.95  # dropping to the cheapest level must bring the mean under this share of where the drops started
+GOVERNOR_RETRY_WINDOWS = 20  # windows before levels past an unhelpful run of drops are tried again
+
 class GameState(Enum):
     MENU = 1
     PLAYING = 2
+    REPLAY = 3
     # Removed "FINISHED" state because we want the game to keep running
     # We will handle the game-over screen as an overlay in PLAYING
 
+# Per-kart state lives in KartFleet arrays; Kart attributes of the same name are views onto them
+KART_FIELDS = {
+    'x': np.float64,
+    'y': np.float64,
+    'angle': np.float64,
+    'speed': np.float64,
+    'base_max_speed': np.float64,
+    'current_max_speed': np.float64,
+    'acceleration': np.float64,
+    'friction': np.float64,
+    'turn_speed': np.float64,
+    'current_lap': np.int64,
+    'last_checkpoint': np.int64,
+    'finished': np.bool_,
+    'finish_time': np.float64,
+    'position': np.int64,
+    'invincible_timer': np.int64,
+    'respawns': np.int64,
+    'progress': np.float64,
+    'seg_hint': np.int64,
+    'seg_dist': np.float64,
+    'is_player': np.bool_,
+    'is_ai': np.bool_,
+    'current_waypoint': np.int64,
+    'lane_offset': np.float64,
+    'controls': np.uint8,
+    'lod_far': np.bool_,
+    'line_s': np.float64,
+    'on_road': np.bool_,
+}
+
+# Player input as bits in KartFleet.controls, so each human kart can be driven separately
+INPUT_UP = 1
+INPUT_DOWN = 2
+INPUT_LEFT = 4
+INPUT_RIGHT = 8
+
+def input_bits(keys):
+    # Pack a pygame key state (arrows or WASD) into INPUT_* bits
+    bits = 0
+    if keys[pygame.K_UP] or keys[pygame.K_w]:
+        bits |= INPUT_UP
+    if keys[pygame.K_DOWN] or keys[pygame.K_s]:
+        bits |= INPUT_DOWN
+    if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+        bits |= INPUT_LEFT
+    if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+        bits |= INPUT_RIGHT
+    return bits
+
+class SpatialHash:
+    # Uniform grid over a set of points, rebuilt in one pass per tick.
+    # Answers "everything within r of these query points" without an O(n*m) scan,
+    # except for small sets where the scan is a single array op and cheaper.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.build(np.zeros(0), np.zeros(0))
+
+    def cell_keys(self, cx, cy):
+        return (cx << 32) + (cy + (1 << 31))
+
+    def build(self, xs, ys):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+        cx = np.floor(self.xs / self.cell_size).astype(np.int64)
+        cy = np.floor(self.ys / self.cell_size).astype(np.int64)
+        keys = self.cell_keys(cx, cy)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def pairs_within(self, qx, qy, r):
+        # Returns (query index, point index, dx, dy, dist) for every pair closer than r,
+        # with dx/dy measured from the point to the query
+        qx = np.asarray(qx, dtype=np.float64)
+        qy = np.asarray(qy, dtype=np.float64)
+        if len(qx) * len(self.xs) <= BRUTE_PAIRS:
+            dx = qx[:, None] - self.xs[None, :]
+            dy = qy[:, None] - self.ys[None, :]
+            dist = np.hypot(dx, dy)
+            qi, pi = np.nonzero(dist < r)
+            return qi, pi, dx[qi, pi], dy[qi, pi], dist[qi, pi]
+
+        ring = int(math.ceil(r / self.cell_size))
+        qcx = np.floor(qx / self.cell_size).astype(np.int64)
+        qcy = np.floor(qy / self.cell_size).astype(np.int64)
+        query = np.arange(len(qx))
+
+        qi_parts = []
+        pi_parts = []
+        for ox in range(-ring, ring + 1):
+            for oy in range(-ring, ring + 1):
+                keys = self.cell_keys(qcx + ox, qcy + oy)
+                lo = np.searchsorted(self.sorted_keys, keys, 'left')
+                hi = np.searchsorted(self.sorted_keys, keys, 'right')
+                counts = hi - lo
+                total = counts.sum()
+                if total == 0:
+                    continue
+                # Expand each [lo, hi) bucket range into flat pair lists
+                run_start = np.repeat(np.cumsum(counts) - counts, counts)
+                pos = np.repeat(lo, counts) + np.arange(total) - run_start
+                qi_parts.append(np.repeat(query, counts))
+                pi_parts.append(self.order[pos])
+
+        if not qi_parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0), np.zeros(0), np.zeros(0)
+
+        qi = np.concatenate(qi_parts)
+        pi = np.concatenate(pi_parts)
+        dx = qx[qi] - self.xs[pi]
+        dy = qy[qi] - self.ys[pi]
+        dist = np.hypot(dx, dy)
+        keep = dist < r
+        return qi[keep], pi[keep], dx[keep], dy[keep], dist[keep]
+
+class SegmentBVH:
+    # Bounding-volume hierarchy over track segment boxes, built by median splits.
+    # Viewport and nearest-segment queries visit O(log n) nodes instead of every segment.
+    def __init__(self, boxes, seg_a, seg_vec):
+        # boxes: (n, 4) min x, min y, max x, max y per segment
+        self.boxes = boxes
+        self.seg_a = seg_a
+        self.seg_vec = seg_vec
+        self.seg_len2 = np.maximum(seg_vec[:, 0]**2 + seg_vec[:, 1]**2, 1e-9)
+        self.order = np.arange(len(boxes))
+        self.node_box = []
+        self.node_children = []  # (left, right), or None for a leaf
+        self.node_range = []     # leaf: slice of self.order
+        if len(boxes):
+            self.split(0, len(boxes))
+        # The tree as arrays, for batched nearest-segment queries; leaves have no children (-1).
+        # Those use each node's box around its centerline segments alone (the road boxes are far
+        # wider), and the node's first vertex, whose distance bounds how far its nearest segment can be
+        self.child_array = np.array([children or (-1, -1) for children in self.node_children], dtype=np.int64).reshape(-1, 2)
+        self.range_array = np.array(self.node_range, dtype=np.int64).reshape(-1, 2)
+        self.line_box = np.zeros((len(self.node_box), 4))
+        for node in range(len(self.node_box) - 1, -1, -1):
+            children = self.node_children[node]
+            if children:
+                b = self.line_box[list(children)]
+            else:
+                ids = self.order[slice(*self.node_range[node])]
+                b = np.concatenate([seg_a[ids], seg_a[ids] + seg_vec[ids]])
+                b = np.concatenate([b, b], axis=1)
+            self.line_box[node] = b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max()
+        self.line_vertex = seg_a[self.order[self.range_array[:, 0]]] if len(boxes) else np.zeros((0, 2))
+
+    def split(self, start, end):
+        ids = self.order[start:end]
+        b = self.boxes[ids]
+        node = len(self.node_box)
+        self.node_box.append((b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max()))
+        self.node_children.append(None)
+        self.node_range.append((start, end))
+        if end - start > LEAF_SEGMENTS:
+            # Halve along the longer axis of the box centres
+            centre = (b[:, :2] + b[:, 2:]) / 2
+            spread = centre.max(axis=0) - centre.min(axis=0)
+            axis = 1 if spread[1] > spread[0] else 0
+            mid = (end - start) // 2
+            self.order[start:end] = ids[np.argpartition(centre[:, axis], mid)]
+            left = self.split(start, start + mid)
+            right = self.split(start + mid, end)
+            self.node_children[node] = (left, right)
+        return node
+
+    def query_rect(self, x0, y0, x1, y1):
+        # Segments whose box overlaps the rectangle, in track order
+        found = []
+        stack = [0] if self.node_box else []
+        while stack:
+            node = stack.pop()
+            bx0, by0, bx1, by1 = self.node_box[node]
+            if bx0 > x1 or bx1 < x0 or by0 > y1 or by1 < y0:
+                continue
+            children = self.node_children[node]
+            if children:
+                stack.extend(children)
+            else:
+                start, end = self.node_range[node]
+                found.append(self.order[start:end])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        ids = np.concatenate(found)
+        b = self.boxes[ids]
+        keep = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+        return np.sort(ids[keep])
+
+    def nearest(self, x, y):
+        # (segment, t along it, distance) for the segment closest to the point
+        seg, t, dist = self.nearest_many(np.array([x], dtype=np.float64), np.array([y], dtype=np.float64))
+        return int(seg[0]), float(t[0]), float(dist[0])
+
+    def nearest_many(self, xs, ys):
+        # nearest() for a batch of points in array ops, walking the tree one level at a time.
+        # A node whose centerline box is further from a point than the closest vertex seen so
+        # far is dropped with its whole subtree; only the leaves left have their segments tested
+        if not len(xs) or not len(self.line_box):
+            return np.zeros(len(xs), dtype=np.int64), np.zeros(len(xs)), np.full(len(xs), np.inf)
+        bound = np.full(len(xs), np.inf)
+        qi = np.arange(len(xs))
+        node = np.zeros(len(xs), dtype=np.int64)
+        leaf_qi = []
+        leaf_node = []
+        leaf_near = []
+        while len(qi):
+            x = xs[qi]
+            y = ys[qi]
+            bx0, by0, bx1, by1 = self.line_box[node].T
+            near = np.hypot(np.maximum(np.maximum(bx0 - x, x - bx1), 0), np.maximum(np.maximum(by0 - y, y - by1), 0))
+            vertex = self.line_vertex[node]
+            np.minimum.at(bound, qi, np.hypot(x - vertex[:, 0], y - vertex[:, 1]))
+            keep = near <= bound[qi]
+            qi, node, near = qi[keep], node[keep], near[keep]
+            leaf = self.child_array[node, 0] < 0
+            leaf_qi.append(qi[leaf])
+            leaf_node.append(node[leaf])
+            leaf_near.append(near[leaf])
+            qi = np.repeat(qi[~leaf], 2)
+            node = self.child_array[node[~leaf]].ravel()
+
+        # Leaves reached early may since have been ruled out by a tighter bound
+        qi = np.concatenate(leaf_qi)
+        leaf = np.concatenate(leaf_node)
+        keep = np.concatenate(leaf_near) <= bound[qi]
+        qi, leaf = qi[keep], leaf[keep]
+
+        # Expand (point, leaf) pairs to (point, segment) pairs
+        start = self.range_array[leaf, 0]
+        count = self.range_array[leaf, 1] - start
+        first = np.cumsum(count) - count
+        qi = np.repeat(qi, count)
+        ids = self.order[np.repeat(start - first, count) + np.arange(count.sum())]
+        px = xs[qi] - self.seg_a[ids, 0]
+        py = ys[qi] - self.seg_a[ids, 1]
+        vx = self.seg_vec[ids, 0]
+        vy = self.seg_vec[ids, 1]
+        t = np.clip((px * vx + py * vy) / self.seg_len2[ids], 0.0, 1.0)
+        dist = np.hypot(px - t * vx, py - t * vy)
+
+        # Closest pair per point: pairs are grouped by point, so sort by distance within groups
+        pick = np.lexsort((ids, dist, qi))
+        pick = pick[np.r_[True, qi[pick][1:] != qi[pick][:-1]]]
+        return ids[pick], t[pick], dist[pick]
+
+class KartFleet:
+    # Struct-of-arrays store for every kart in a race.
+    # step() runs the Kart/AIKart driving rules for the whole field at once.
+    def __init__(self):
+        self.karts = []
+        self.waypoints = None
+        self.prev_pose = None
+        self.neighbours = SpatialHash(AVOID_RADIUS)
+        self.lod = False  # AI level of detail around the player karts, see update_lod
+        self.ticks = 0
+        self.line_tick = None  # tick whose update_progress last set line_s for the whole fleet
+        # Kart indices best-first, kept nearly sorted between ticks
+        self.order = np.zeros(0, dtype=np.int64)
+        # Kart indices by the left edge of their bounding box, for the collision sweep
+        self.sweep_order = np.zeros(0, dtype=np.int64)
+        for name, dtype in KART_FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+
+    def __len__(self):
+        return len(self.karts)
+
+    def add(self, kart):
+        for name in KART_FIELDS:
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate([arr, np.zeros(1, dtype=arr.dtype)]))
+        self.karts.append(kart)
+        self.order = np.append(self.order, len(self.karts) - 1)
+        self.sweep_order = np.append(self.sweep_order, len(self.karts) - 1)
+        return len(self.karts) - 1
+
+    def set_waypoints(self, waypoints):
+        # All AI karts in one fleet follow the same waypoint list
+        if self.waypoints is None:
+            self.waypoints = np.asarray(waypoints, dtype=np.float64)
+
+    def snapshot(self):
+        # Remember poses before a tick so frames can be drawn between ticks
+        self.prev_pose = (self.x.copy(), self.y.copy(), self.angle.copy())
+
+    def interpolate(self, alpha):
+        # Poses a fraction alpha of the way from the previous tick to the current one
+        if self.prev_pose is None or len(self.prev_pose[0]) != len(self):
+            return self.x, self.y, self.angle
+        px, py, pa = self.prev_pose
+        dx = self.x - px
+        dy = self.y - py
+        snap = np.hypot(dx, dy) > TELEPORT_DIST
+        x = np.where(snap, self.x, px + dx * alpha)
+        y = np.where(snap, self.y, py + dy * alpha)
+        angle = pa + ((self.angle - pa + 180) % 360 - 180) * alpha
+        angle = np.where(snap, self.angle, angle)
+        return x, y, angle
+
+    def step(self, keys=None, track=None):
+        # Update the whole field; AI karts avoid every unfinished kart in the fleet
+        sel = np.arange(len(self))
+        self.ticks += 1
+        if self.lod and track:
+            self.update_lod()
+        alive = np.nonzero(~self.finished)[0]
+        self.neighbours.build(self.x[alive], self.y[alive])
+        self.update(sel, keys, track, (self.neighbours, alive))
+
+    def update(self, sel, keys=None, track=None, neighbours=None):
+        # keys: pygame key state for every player kart in sel; without it each kart keeps its controls
+        # neighbours: (SpatialHash of unfinished karts, fleet index of each hashed kart)
+        if keys:
+            self.controls[sel[self.is_player[sel]]] = input_bits(keys)
+        x = self.x[sel]
+        y = self.y[sel]
+        angle = self.angle[sel]
+        speed = self.speed[sel]
+        cms = self.current_max_speed[sel]
+        finished = self.finished[sel]
+        racing = ~finished
+
+        inv = self.invincible_timer[sel]
+        self.invincible_timer[sel] = np.where(inv > 0, inv - 1, inv)
+
+        # -- FINISH LINE BEHAVIOR --
+        # If finished, ignore inputs and brake to a stop
+        braked = np.where(speed > 0, np.maximum(speed - 0.15, 0), np.minimum(speed + 0.15, 0))
+
+        # Check surface type
+        if track:
+            on_road = (track.surface_at_many(x, y) & SURFACE_ROAD) != 0
+        else:
+            on_road = np.ones(len(sel), dtype=bool)
+        cms = np.where(racing, np.where(on_road, self.base_max_speed[sel], 3.0), cms)
+        self.on_road[sel] = on_road
+
+        kart = racing & ~self.is_ai[sel]
+        if kart.any():
+            angle, speed = self.drive(sel, kart, on_road, angle, speed, cms)
+
+        ai = np.nonzero(racing & self.is_ai[sel])[0]
+        if len(ai):
+            angle[ai], speed[ai] = self.steer_ai(sel[ai], track, x[ai], y[ai], angle[ai], speed[ai], cms[ai], neighbours)
+
+        speed = np.where(finished, braked, speed)
+
+        rad = np.radians(angle)
+        self.x[sel] = x + speed * np.sin(rad)
+        self.y[sel] = y - speed * np.cos(rad)
+        self.angle[sel] = angle
+        self.speed[sel] = speed
+        self.current_max_speed[sel] = cms
+
+    def drive(self, sel, kart, on_road, angle, speed, cms):
+        # Player / plain karts: grass slowdown, controls, speed cap, friction
+        speed = np.where(kart & ~on_road & (speed > 3.0), speed * 0.95, speed)
+
+        player = kart & self.is_player[sel]
+        controls = np.where(player, self.controls[sel], 0)
+        if controls.any():
+            acc = self.acceleration[sel]
+            up = (controls & INPUT_UP) != 0
+            down = ~up & ((controls & INPUT_DOWN) != 0)
+            speed = np.where(up & (speed < cms), speed + acc, speed)
+            speed = np.where(down, speed - acc, speed)
+
+            turning = np.abs(speed) > 0.5
+            turn = self.turn_speed[sel] * np.where(speed > 0, 1, -1)
+            angle = np.where(turning & ((controls & INPUT_LEFT) != 0), angle - turn, angle)
+            angle = np.where(turning & ((controls & INPUT_RIGHT) != 0), angle + turn, angle)
+
+        # Cap speed
+        speed = np.where(kart & (speed > cms), speed - 0.1, speed)
+
+        # Friction
+        friction = self.friction[sel]
+        slowed = np.where(speed > 0, np.maximum(0, speed - friction), np.minimum(0, speed + friction))
+        speed = np.where(kart, slowed, speed)
+        return angle, speed
+
+    def steer_ai(self, sel, track, x, y, angle, speed, cms, neighbours):
+        # AI Targeting Logic
+        if track:
+            # Follow the track's precomputed racing line: table lookups only
+            line = track.racing_line
+            # Arc positions come from last tick's update_progress; callers that skip it project here
+            if self.line_tick is None or self.line_tick != self.ticks - 1:
+                self.line_s[sel] = self.project(track, sel)
+            here = np.searchsorted(line['s'], self.line_s[sel], side='right') - 1
+            arc = line['arc']
+            ahead = (arc[here] + LINE_LOOKAHEAD + np.abs(speed) * LINE_LOOKAHEAD_GAIN) % arc[-1]
+            ahead = np.searchsorted(arc, ahead, side='right') - 1
+            lane = self.lane_offset[sel] * LANE_SCALE
+            target_x = line['x'][ahead] + line['nx'][ahead] * lane
+            target_y = line['y'][ahead] + line['ny'][ahead] * lane
+            # Speed profile was built for the default turn rate; faster steering corners faster
+            line_speed = line['speed'][here] * (self.turn_speed[sel] / LINE_TURN_SPEED)
+        else:
+            # No track: steer at the raw waypoints
+            wp = self.current_waypoint[sel]
+            tx = self.waypoints[wp, 0]
+            ty = self.waypoints[wp, 1]
+
+            dist_to_target = np.hypot(tx - x, ty - y)
+            offset_strength = np.minimum(1.0, dist_to_target / 300.0)
+
+            lane = self.lane_offset[sel] * offset_strength
+            target_x = tx + np.cos(np.radians(wp * 10)) * lane
+            target_y = ty + np.sin(np.radians(wp * 10)) * lane
+            self.current_waypoint[sel] = np.where(np.hypot(target_x - x, target_y - y) < 200,
+                                                  (wp + 1) % len(self.waypoints), wp)
+            line_speed = cms
+
+        dx = target_x - x
+        dy = target_y - y
+
+        target_angle = np.degrees(np.arctan2(dx, -dy))
+        diff = (target_angle - angle + 180) % 360 - 180
+
+        avoid_turn = np.zeros(len(sel))
+
+        # Avoid other karts. The neighbour query is the expensive part: karts on reduced detail
+        # (lod_far) run it every LOD_INTERVAL ticks, staggered by index, with the push scaled to match
+        if neighbours is not None:
+            query = np.nonzero(~self.lod_far[sel] | ((sel + self.ticks) % LOD_INTERVAL == 0))[0]
+            grid, ids = neighbours
+            qi, pi, ox, oy, d = grid.pairs_within(x[query], y[query], AVOID_RADIUS)
+            keep = ids[pi] != sel[query][qi]
+            qi, ox, oy, d = qi[keep], ox[keep], oy[keep], d[keep]
+            push_angle = np.degrees(np.arctan2(ox, -oy))
+            a_diff = (push_angle - angle[query][qi] + 180) % 360 - 180
+            avoid_turn[query] = np.bincount(qi, weights=a_diff * (50 / np.maximum(d, 1)), minlength=len(query))
+            avoid_turn = np.where(self.lod_far[sel], avoid_turn * LOD_INTERVAL, avoid_turn)
+
+        # Hazard safety net: only karts pushed off the line into a hazard's clearance band react
+        if track and len(track.hazard_xy):
+            qi, pi, hx, hy, d = track.hazard_grid.pairs_within(x, y, track.hazard_reach)
+            keep = d < track.hazard_radius[pi] * HAZARD_HIT_SCALE + HAZARD_CLEARANCE
+            qi, hx, hy = qi[keep], hx[keep], hy[keep]
+            avoid_angle = np.degrees(np.arctan2(hx, -hy))
+            a_diff = (avoid_angle - angle[qi] + 180) % 360 - 180
+            avoid_turn += np.bincount(qi, weights=a_diff * 2, minlength=len(sel))
+
+        final_turn = diff + np.clip(avoid_turn, -40, 40)
+
+        # Steering
+        turn_amt = np.minimum(np.abs(final_turn), self.turn_speed[sel])
+        angle = np.where(np.abs(final_turn) > 2, angle + np.sign(final_turn) * turn_amt, angle)
+
+        # Throttle
+        target_speed = np.minimum(cms, line_speed)
+        target_speed = np.where(np.abs(diff) > 30, target_speed * 0.6, target_speed)
+        target_speed = np.where(np.abs(diff) > 60, target_speed * 0.4, target_speed)
+
+        speed = np.where(speed < target_speed, speed + self.acceleration[sel],
+                         np.where(speed > target_speed, speed - 0.1, speed))
+        return angle, speed
+
+    def update_lod(self):
+        # Reach of each kart: view half-extents to the nearest player kart (the camera follows them).
+        # Karts just respawned stay at full detail while invincible: a respawn breaks dead reckoning
+        focus = np.nonzero(self.is_player)[0]
+        if not len(focus):
+            return
+        dx = np.abs(self.x[:, None] - self.x[focus]) / (SCREEN_WIDTH / 2)
+        dy = np.abs(self.y[:, None] - self.y[focus]) / (SCREEN_HEIGHT / 2)
+        reach = np.maximum(dx, dy).min(axis=1)
+        self.lod_far[:] = self.is_ai & (self.invincible_timer == 0) & (reach > np.where(self.lod_far, LOD_NEAR, LOD_FAR))
+
+    def collide(self):
+        # Push overlapping kart boxes apart and trade momentum along the contact normal.
+        # Finished karts are out of the race; karts just respawned are ghosts while invincible.
+        # Far karts (lod_far) are only checked every LOD_INTERVAL ticks, all on the same tick
+        n = len(self)
+        if n < 2:
+            return
+        rad = np.radians(self.angle)
+        fx, fy = np.sin(rad), -np.cos(rad)
+        hw, hh = KART_WIDTH / 2, KART_HEIGHT / 2
+        # Axis-aligned extents of each rotated box
+        ex = hw * np.abs(fy) + hh * np.abs(fx)
+        ey = hw * np.abs(fx) + hh * np.abs(fy)
+
+        # Sweep and prune along x. Last tick's order is nearly sorted, and a stable
+        # argsort (timsort) finds the runs, so the re-sort stays close to linear
+        lo = self.x - ex
+        order = self.sweep_order
+        order = order[np.argsort(lo[order], kind='stable')]
+        self.sweep_order = order
+        active = ~self.finished[order] & (self.invincible_timer[order] == 0)
+        if self.ticks % LOD_INTERVAL:
+            active &= ~self.lod_far[order]
+        order = order[active]
+        lo = lo[order]
+        hi = self.x[order] + ex[order]
+
+        # Each box against the boxes after it that start before it ends
+        pos = np.arange(len(order))
+        count = np.searchsorted(lo, hi, side='right') - pos - 1
+        total = count.sum()
+        if not total:
+            return
+        first = np.repeat(pos, count)
+        second = first + 1 + np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+        a = order[first]
+        b = order[second]
+        dx = self.x[b] - self.x[a]
+        dy = self.y[b] - self.y[a]
+        keep = np.abs(dy) <= ey[a] + ey[b]
+        a, b, dx, dy = a[keep], b[keep], dx[keep], dy[keep]
+        if not len(a):
+            return
+
+        # Separating axis test on the two boxes' own axes (forward and right of each);
+        # the axis with the least overlap is the contact normal
+        axis_x = np.stack([fx[a], -fy[a], fx[b], -fy[b]], axis=1)
+        axis_y = np.stack([fy[a], fx[a], fy[b], fx[b]], axis=1)
+        def extent(i):
+            along = np.abs(fx[i][:, None] * axis_x + fy[i][:, None] * axis_y)
+            across = np.abs(-fy[i][:, None] * axis_x + fx[i][:, None] * axis_y)
+            return hh * along + hw * across
+        dist = dx[:, None] * axis_x + dy[:, None] * axis_y
+        overlap = extent(a) + extent(b) - np.abs(dist)
+        rows = np.arange(len(a))
+        best = np.argmin(overlap, axis=1)
+        depth = overlap[rows, best]
+        hit = depth > 0
+        if not hit.any():
+            return
+        a, b, rows, best, depth = a[hit], b[hit], rows[hit], best[hit], depth[hit]
+        side = np.where(dist[rows, best] >= 0, 1.0, -1.0)
+        nx = axis_x[rows, best] * side  # unit normal from a towards b
+        ny = axis_y[rows, best] * side
+
+        # Equal masses: each kart moves half the overlap. Velocity is speed along the heading, so the
+        # bounce impulse is projected back onto it and the sideways part is lost to the tyres
+        va = self.speed[a] * (fx[a] * nx + fy[a] * ny)
+        vb = self.speed[b] * (fx[b] * nx + fy[b] * ny)
+        impulse = np.maximum(va - vb, 0) * (1 + BUMP_RESTITUTION) / 2
+        push = depth / 2
+        self.x += np.bincount(b, nx * push, n) - np.bincount(a, nx * push, n)
+        self.y += np.bincount(b, ny * push, n) - np.bincount(a, ny * push, n)
+        self.speed += np.bincount(b, impulse * (fx[b] * nx + fy[b] * ny), n) - \
+                      np.bincount(a, impulse * (fx[a] * nx + fy[a] * ny), n)
+
+    def respawn(self, sel, track_checkpoints):
+        # Don't respawn if race is over for this kart
+        sel = sel[~self.finished[sel]]
+        if not len(sel):
+            return
+
+        centers = np.array([cp['center'] for cp in track_checkpoints], dtype=np.float64)
+        last = self.last_checkpoint[sel]
+        self.x[sel] = centers[last, 0]
+        self.y[sel] = centers[last, 1]
+        self.speed[sel] = 0
+        self.respawns[sel] += 1
+        self.seg_hint[sel] = [track_checkpoints[i]['idx'] for i in last]
+
+        # Face next checkpoint (math.atan2 per kart: respawns are rare and this matches Kart-by-Kart races)
+        next_idx = (last + 1) % len(track_checkpoints)
+        dx = centers[next_idx, 0] - centers[last, 0]
+        dy = centers[next_idx, 1] - centers[last, 1]
+        self.angle[sel] = [math.degrees(math.atan2(a, -b)) for a, b in zip(dx.tolist(), dy.tolist())]
+
+        self.invincible_timer[sel] = 120
+
+    def check_checkpoints(self, checkpoint_xy, total_laps, game_time, sel=None):
+        # game_time: race clock, or one per kart when the fleet holds independent races.
+        # Returns the karts that reached their next checkpoint
+        if sel is None:
+            sel = np.arange(len(self))
+        # Don't check if already finished
+        active = sel[~self.finished[sel]]
+
+        next_idx = (self.last_checkpoint[active] + 1) % len(checkpoint_xy)
+        cp = checkpoint_xy[next_idx]
+        hit = np.hypot(self.x[active] - cp[:, 0], self.y[active] - cp[:, 1]) < 200
+
+        passed = active[hit]
+        next_idx = next_idx[hit]
+        self.last_checkpoint[passed] = next_idx
+
+        lapped = passed[next_idx == 0]
+        self.current_lap[lapped] += 1
+        done = lapped[self.current_lap[lapped] > total_laps]
+        self.finished[done] = True
+        # Record time immediately
+        self.finish_time[done] = np.broadcast_to(game_time, self.finish_time.shape)[done]
+        return passed
+
+    def project(self, track, sel):
+        # Arc position of the selected karts, searching only around each cached segment hint
+        n_seg = len(track.arc_start)
+        cand = (self.seg_hint[sel][:, None] + track.segment_window[None, :]) % n_seg
+        ax = track.seg_a[cand, 0]
+        ay = track.seg_a[cand, 1]
+        vx = track.seg_vec[cand, 0]
+        vy = track.seg_vec[cand, 1]
+        px = self.x[sel][:, None] - ax
+        py = self.y[sel][:, None] - ay
+        t = np.clip((px * vx + py * vy) / track.seg_len2[cand], 0.0, 1.0)
+        d2 = (px - t * vx)**2 + (py - t * vy)**2
+        best = np.argmin(d2, axis=1)
+        rows = np.arange(len(cand))
+        seg = cand[rows, best]
+        t = t[rows, best]
+
+        # A hint that no longer matches (kart far from all of its segments, or suddenly much further
+        # from the best one than last tick: it outran the window) falls back to a full search
+        dist = np.sqrt(d2[rows, best])
+        lost = np.nonzero((dist > track.track_width * HINT_LOST_WIDTHS) | (dist > self.seg_dist[sel] + HINT_JUMP))[0]
+        if len(lost):
+            seg[lost], t[lost], dist[lost] = track.segments.nearest_many(self.x[sel[lost]], self.y[sel[lost]])
+
+        self.seg_hint[sel] = seg
+        self.seg_dist[sel] = dist
+        return track.arc_start[seg] + t * track.seg_len[seg]
+
+    def update_progress(self, track):
+        s = self.project(track, np.arange(len(self)))
+        # The AI steers off this same projection next tick
+        self.line_s = s
+        self.line_tick = self.ticks
+
+        # Unwrap around the last checkpoint so laps stay continuous across the line
+        lap_len = track.lap_length
+        s_cp = track.checkpoint_s[self.last_checkpoint]
+        ds = (s - s_cp + lap_len / 2) % lap_len - lap_len / 2
+        self.progress = (self.current_lap - 1) * lap_len + s_cp + ds
+
+    def update_positions(self, track):
+        # Finished karts are ranked by time, the rest by distance raced
+        self.update_progress(track)
+        key = np.where(self.finished, FINISHED_RANK - self.finish_time, self.progress)
+
+        # Odd-even transposition passes over last tick's order: each pass is one
+        # array op and the order only changes where karts overtook each other
+        order = self.order
+        ranked = key[order]
+        swapped = True
+        while swapped:
+            swapped = False
+            for start in (0, 1):
+                a = np.arange(start, len(order) - 1, 2)
+                a = a[ranked[a] < ranked[a + 1]]
+                if len(a):
+                    order[a], order[a + 1] = order[a + 1], order[a]
+                    ranked[a], ranked[a + 1] = ranked[a + 1], ranked[a]
+                    swapped = True
+        self.position[order] = np.arange(1, len(order) + 1)
+
+    def ranked(self):
+        return [self.karts[i] for i in self.order]
+
+class ParticleSystem:
+    # Every particle lives in preallocated arrays; free slots sit on a stack (free[:free_top]),
+    # so emitting and retiring are slice operations and no per-particle objects exist.
+    def __init__(self, capacity=PARTICLE_CAPACITY, seed=None):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.age = np.zeros(capacity)
+        self.life = np.ones(capacity)
+        self.kind = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = np.arange(capacity)[::-1].copy()
+        self.free_top = capacity
+        self.rng = np.random.default_rng(seed)
+
+        # Per-kind tables, indexed by self.kind
+        self.kinds = {name: i for i, name in enumerate(PARTICLE_KINDS)}
+        specs = list(PARTICLE_KINDS.values())
+        self.ramp = np.array([spec['colors'] for spec in specs], dtype=np.float64)
+        self.drift = np.array([spec['drift'] for spec in specs])
+        self.drag = np.array([spec['drag'] for spec in specs])
+        self.size = np.array([spec['size'] for spec in specs])
+        # Pixel offsets of each kind's block, padded to the largest block by repeating (0, 0)
+        side = int(self.size.max())
+        self.offset_x = np.zeros((len(specs), side * side), dtype=np.int64)
+        self.offset_y = np.zeros((len(specs), side * side), dtype=np.int64)
+        for k, s in enumerate(self.size):
+            self.offset_x[k, :s * s] = np.repeat(np.arange(s), s)
+            self.offset_y[k, :s * s] = np.tile(np.arange(s), s)
+        self.palette_format = None
+        self.palette_lut = None
+
+    def __len__(self):
+        return self.capacity - self.free_top
+
+    def clear(self):
+        self.alive[:] = False
+        self.free = np.arange(self.capacity)[::-1].copy()
+        self.free_top = self.capacity
+
+    def emit(self, kind, x, y, count, radius=0.0, vx=0.0, vy=0.0):
+        # count particles around (x, y) (scalars or per-particle arrays), spread over a disc of radius;
+        # when the pool is full the surplus is dropped
+        n = min(count, self.free_top)
+        if n <= 0:
+            return
+        spec = PARTICLE_KINDS[kind]
+        idx = self.free[self.free_top - n:self.free_top]
+        self.free_top -= n
+        rng = self.rng
+        if radius:
+            r = radius * np.sqrt(rng.random(n))
+            a = rng.uniform(0, 2 * math.pi, n)
+            x = x + r * np.cos(a)
+            y = y + r * np.sin(a)
+        heading = rng.uniform(0, 2 * math.pi, n)
+        speed = rng.uniform(*spec['speed'], n)
+        self.x[idx] = x
+        self.y[idx] = y
+        self.vx[idx] = vx + speed * np.cos(heading)
+        self.vy[idx] = vy + speed * np.sin(heading)
+        self.age[idx] = 0
+        self.life[idx] = rng.uniform(*spec['life'], n)
+        self.kind[idx] = self.kinds[kind]
+        self.alive[idx] = True
+
+    def update(self):
+        live = np.nonzero(self.alive)[0]
+        if not len(live):
+            return
+        kind = self.kind[live]
+        drag = self.drag[kind]
+        self.vx[live] = self.vx[live] * drag + self.drift[kind, 0]
+        self.vy[live] = self.vy[live] * drag + self.drift[kind, 1]
+        self.x[live] += self.vx[live]
+        self.y[live] += self.vy[live]
+        self.age[live] += 1
+
+        # Expired slots go back on the free stack
+        dead = live[self.age[live] >= self.life[live]]
+        self.alive[dead] = False
+        self.free[self.free_top:self.free_top + len(dead)] = dead
+        self.free_top += len(dead)
+
+    def draw(self, surface, camera_x=0, camera_y=0, scale=1):
+        # One vectorised pass over the live set; no Surface or blit per particle
+        live = np.nonzero(self.alive)[0]
+        if not len(live):
+            return
+        kind = self.kind[live]
+        size = self.size[kind]
+        sx = np.floor(self.x[live] * scale - camera_x).astype(np.int64)
+        sy = np.floor(self.y[live] * scale - camera_y).astype(np.int64)
+        w, h = surface.get_size()
+        on = (sx >= 0) & (sy >= 0) & (sx + size <= w) & (sy + size <= h)
+        if not on.any():
+            return
+        live, kind, size, sx, sy = live[on], kind[on], size[on], sx[on], sy[on]
+
+        # Colour from the age ramp, then every size x size block scattered in one write
+        # through a flat view of the locked pixels
+        step = np.minimum(self.age[live] * PARTICLE_RAMP_STEPS / self.life[live], PARTICLE_RAMP_STEPS - 1)
+        color = self.palette(surface)[kind, step.astype(np.int64)]
+        pixels = pygame.surfarray.pixels2d(surface)
+        row = pixels.strides[1] // pixels.itemsize
+        flat = np.lib.stride_tricks.as_strided(pixels, shape=((h - 1) * row + w,), strides=(pixels.itemsize,))
+        offsets = self.offset_x + self.offset_y * row
+        flat[((sy * row + sx)[:, None] + offsets[kind]).ravel()] = np.repeat(color, offsets.shape[1])
+        del flat, pixels
+
+    def palette(self, surface):
+        # Ramps sampled at PARTICLE_RAMP_STEPS ages and packed into the surface's pixel format
+        fmt = (surface.get_shifts(), surface.get_losses(), surface.get_masks()[3])
+        if fmt != self.palette_format:
+            shifts, losses, alpha = fmt
+            t = np.linspace(0, 2, PARTICLE_RAMP_STEPS)[:, None]
+            first = t < 1
+            lo = np.where(first, self.ramp[:, None, 0], self.ramp[:, None, 1])
+            hi = np.where(first, self.ramp[:, None, 1], self.ramp[:, None, 2])
+            rgb = (lo + (hi - lo) * np.where(first, t, t - 1)).astype(np.uint32)
+            self.palette_lut = (((rgb[..., 0] >> losses[0]) << shifts[0]) | ((rgb[..., 1] >> losses[1]) << shifts[1]) |
+                                ((rgb[..., 2] >> losses[2]) << shifts[2]) | alpha)
+            self.palette_format = fmt
+        return self.palette_lut
+
+class SpriteAtlas:
+    # Kart bodies and shadows pre-rotated at SPRITE_ANGLE_STEP, built once per colour/size.
+    # Each frame keeps its half extents so drawing is a single blit.
+    def __init__(self, step=SPRITE_ANGLE_STEP):
+        self.step = step
+        self.frames = {}
+
+    def build(self, base):
+        display_ready = pygame.display.get_surface() is not None
+        frames = []
+        for i in range(int(round(360 / self.step))):
+            rotated = pygame.transform.rotate(base, -i * self.step)
+            if display_ready:
+                rotated = rotated.convert_alpha()
+            frames.append((rotated, rotated.get_width() // 2, rotated.get_height() // 2))
+        return frames
+
+    def frame(self, key, angle):
+        frames = self.frames.get(key)
+        if frames is None:
+            if key[0] == 'shadow':
+                base = render_kart_shadow(key[1], key[2])
+            else:
+                base = render_kart_body(key[1], key[2], key[3])
+            # Reduced render resolutions get their own, smaller frames
+            scale = key[-1]
+            if scale != 1:
+                size = (max(1, round(base.get_width() * scale)), max(1, round(base.get_height() * scale)))
+                base = pygame.transform.smoothscale(base, size)
+            frames = self.frames[key] = self.build(base)
+        return frames[int(round(angle / self.step)) % len(frames)]
+
+    def kart(self, color, width, height, angle, scale=1):
+        return self.frame(('kart', color, width, height, scale), angle)
+
+    def shadow(self, width, height, angle, scale=1):
+        return self.frame(('shadow', width, height, scale), angle)
+
+def render_kart_body(color, width, height):
+    kart_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    
+    # Tires
+    pygame.draw.rect(kart_surface, (20, 20, 20), (0, 5, 8, 12))   
+    pygame.draw.rect(kart_surface, (20, 20, 20), (22, 5, 8, 12))  
+    pygame.draw.rect(kart_surface, (20, 20, 20), (0, 25, 8, 12))  
+    pygame.draw.rect(kart_surface, (20, 20, 20), (22, 25, 8, 12)) 
+    
+    # Body
+    pygame.draw.rect(kart_surface, color, (6, 10, 18, 26), border_radius=5)
+    
+    # Driver/Helmet
+    pygame.draw.circle(kart_surface, (255, 220, 0), (15, 20), 7)
+    return kart_surface
+
+def render_kart_shadow(width, height):
+    shadow = pygame.Surface((width, height), pygame.SRCALPHA)
+    pygame.draw.rect(shadow, (0,0,0,100), (0,0,width, height), border_radius=5)
+    return shadow
+
+KART_SPRITES = SpriteAtlas()
+
+def fleet_property(name):
+    def get(self):
+        return getattr(self.fleet, name)[self.idx].item()
+    def set(self, value):
+        getattr(self.fleet, name)[self.idx] = value
+    return property(get, set)
+
 class Kart:
-    def __init__(self, x, y, color, is_player=False):
+    def __init__(self, x, y, color, is_player=False, fleet=None):
+        # Standalone karts get a fleet of their own
+        self.fleet = fleet if fleet is not None else KartFleet()
+        self.idx = self.fleet.add(self)
+
         self.x = x
         self.y = y
         self.angle = 90
         self.speed = 0
         self.color = color
         self.is_player = is_player
+        self.is_ai = False
         
         # Stats
         self.base_max_speed = 9.5 if is_player else 8.2
@@ -47,8 +1041,8 @@ class Kart:
         self.friction = 0.06
         self.turn_speed = 4.5
         
-        self.width = 30
-        self.height = 40
+        self.width = KART_WIDTH
+        self.height = KART_HEIGHT
         
         # Race State
         self.current_lap = 1
@@ -58,188 +1052,82 @@ class Kart:
         self.position = 0
         
         self.invincible_timer = 0
+        self.respawns = 0
         
     def update(self, keys=None, track=None, all_karts=None):
-        if self.invincible_timer > 0:
-            self.invincible_timer -= 1
-
-        # -- FINISH LINE BEHAVIOR --
-        # If finished, ignore inputs and brake to a stop
-        if self.finished:
-            if self.speed > 0:
-                self.speed -= 0.15 # Strong braking
-                if self.speed < 0: self.speed = 0
-            elif self.speed < 0:
-                self.speed += 0.15
-                if self.speed > 0: self.speed = 0
-                
-            # Move slightly to simulate momentum
-            rad = math.radians(self.angle)
-            self.x += self.speed * math.sin(rad)
-            self.y -= self.speed * math.cos(rad)
-            return
-
-        # Check surface type
-        on_road = track.is_on_road(self.x, self.y) if track else True
-        
-        if on_road:
-            self.current_max_speed = self.base_max_speed
-        else:
-            # Grass slowdown
-            self.current_max_speed = 3.0
-            if self.speed > 3.0:
-                self.speed *= 0.95
-
-        if self.is_player and keys:
-            if keys[pygame.K_UP] or keys[pygame.K_w]:
-                if self.speed < self.current_max_speed:
-                    self.speed += self.acceleration
-            elif keys[pygame.K_DOWN] or keys[pygame.K_s]:
-                self.speed -= self.acceleration
-            
-            if abs(self.speed) > 0.5:
-                direction = 1 if self.speed > 0 else -1
-                if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-                    self.angle -= self.turn_speed * direction
-                if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-                    self.angle += self.turn_speed * direction
-        
-        # Cap speed
-        if self.speed > self.current_max_speed:
-            self.speed -= 0.1 
-            
-        # Friction
-        if self.speed > 0:
-            self.speed = max(0, self.speed - self.friction)
-        elif self.speed < 0:
-            self.speed = min(0, self.speed + self.friction)
-        
-        rad = math.radians(self.angle)
-        self.x += self.speed * math.sin(rad)
-        self.y -= self.speed * math.cos(rad)
+        # Single-kart step through the same array rules as KartFleet.step
+        neighbours = None
+        if all_karts:
+            others = [k for k in all_karts if k is not self and not k.finished]
+            grid = SpatialHash(AVOID_RADIUS)
+            grid.build([k.x for k in others], [k.y for k in others])
+            neighbours = (grid, np.full(len(others), -1))
+        self.fleet.update(np.array([self.idx]), keys, track, neighbours)
     
     def respawn(self, track_checkpoints):
-        # Don't respawn if race is over for this kart
-        if self.finished: return
-
-        safe_point = track_checkpoints[self.last_checkpoint]['center']
-        self.x = safe_point[0]
-        self.y = safe_point[1]
-        self.speed = 0
-        
-        # Face next checkpoint
-        next_idx = (self.last_checkpoint + 1) % len(track_checkpoints)
-        next_point = track_checkpoints[next_idx]['center']
-        dx = next_point[0] - self.x
-        dy = next_point[1] - self.y
-        self.angle = math.degrees(math.atan2(dx, -dy))
-        
-        self.invincible_timer = 120 
+        self.fleet.respawn(np.array([self.idx]), track_checkpoints)
     
-    def draw(self, screen, camera_x=0, camera_y=0):
+    def draw(self, screen, camera_x=0, camera_y=0, pose=None, scale=1):
+        # pose: optional (x, y, angle) to draw at instead of the simulated one
+        # scale: render resolution; the camera is in scaled pixels
         if self.invincible_timer > 0 and (self.invincible_timer // 5) % 2 == 0:
             return
 
-        kart_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        
-        # Tires
-        pygame.draw.rect(kart_surface, (20, 20, 20), (0, 5, 8, 12))   
-        pygame.draw.rect(kart_surface, (20, 20, 20), (22, 5, 8, 12))  
-        pygame.draw.rect(kart_surface, (20, 20, 20), (0, 25, 8, 12))  
-        pygame.draw.rect(kart_surface, (20, 20, 20), (22, 25, 8, 12)) 
-        
-        # Body
-        pygame.draw.rect(kart_surface, self.color, (6, 10, 18, 26), border_radius=5)
-        
-        # Driver/Helmet
-        pygame.draw.circle(kart_surface, (255, 220, 0), (15, 20), 7)
-        
-        rotated = pygame.transform.rotate(kart_surface, -self.angle)
-        rect = rotated.get_rect(center=(int(self.x - camera_x), int(self.y - camera_y)))
-        screen.blit(rotated, rect)
+        x, y, angle = pose or (self.x, self.y, self.angle)
+        sprite, half_w, half_h = KART_SPRITES.kart(self.color, self.width, self.height, angle, scale)
+        screen.blit(sprite, (int(x * scale - camera_x) - half_w, int(y * scale - camera_y) - half_h))
+
+    def draw_shadow(self, screen, camera_x=0, camera_y=0, pose=None, scale=1):
+        x, y, angle = pose or (self.x, self.y, self.angle)
+        sprite, half_w, half_h = KART_SPRITES.shadow(self.width, self.height, angle, scale)
+        screen.blit(sprite, (int((x + 5) * scale - camera_x) - half_w, int((y + 5) * scale - camera_y) - half_h))
 
 class AIKart(Kart):
-    def __init__(self, x, y, color, waypoints):
-        super().__init__(x, y, color, is_player=False)
+    def __init__(self, x, y, color, waypoints, rng=None, fleet=None):
+        super().__init__(x, y, color, is_player=False, fleet=fleet)
+        self.is_ai = True
         self.waypoints = waypoints
+        self.fleet.set_waypoints(waypoints)
         self.current_waypoint = 0
-        self.lane_offset = random.uniform(-40, 40)
-        
-    def update(self, keys=None, track=None, all_karts=None):
-        if self.finished:
-            super().update(keys, track, all_karts) # Call parent to handle braking
-            return
+        self.lane_offset = (rng or random).uniform(-40, 40)
 
-        if self.invincible_timer > 0:
-            self.invincible_timer -= 1
-            
-        on_road = track.is_on_road(self.x, self.y) if track else True
-        self.current_max_speed = self.base_max_speed if on_road else 3.0
+for _name in KART_FIELDS:
+    setattr(Kart, _name, fleet_property(_name))
 
-        # AI Targeting Logic
-        tx, ty = self.waypoints[self.current_waypoint]
-        
-        dist_to_target = math.sqrt((tx - self.x)**2 + (ty - self.y)**2)
-        offset_strength = min(1.0, dist_to_target / 300.0) 
-        
-        target_x = tx + (math.cos(math.radians(self.current_waypoint * 10)) * self.lane_offset * offset_strength)
-        target_y = ty + (math.sin(math.radians(self.current_waypoint * 10)) * self.lane_offset * offset_strength)
-        
-        dx = target_x - self.x
-        dy = target_y - self.y
-        dist = math.sqrt(dx*dx + dy*dy)
-        
-        target_angle = math.degrees(math.atan2(dx, -dy))
-        diff = (target_angle - self.angle + 180) % 360 - 180
-        
-        if dist < 200:
-            self.current_waypoint = (self.current_waypoint + 1) % len(self.waypoints)
+def poly_raster(cx, cy, poly):
+    # Even-odd fill of a polygon over a grid of cell centres (cx: columns, cy: rows).
+    # Same rule as a per-point ray cast, but each edge only visits the rows it spans,
+    # so the cost follows the perimeter rather than cells x edges.
+    p1 = np.asarray(poly, dtype=np.float64)
+    p2 = np.roll(p1, -1, axis=0)
+    sloped = p1[:, 1] != p2[:, 1]
+    p1, p2 = p1[sloped], p2[sloped]
+    y_lo = np.minimum(p1[:, 1], p2[:, 1])
+    y_hi = np.maximum(p1[:, 1], p2[:, 1])
 
-        avoid_turn = 0
-        
-        # Avoid other karts
-        if all_karts:
-            for other in all_karts:
-                if other != self and not other.finished:
-                    d = math.sqrt((self.x - other.x)**2 + (self.y - other.y)**2)
-                    if d < 70:
-                        push_angle = math.degrees(math.atan2(self.x - other.x, -(self.y - other.y)))
-                        a_diff = (push_angle - self.angle + 180) % 360 - 180
-                        avoid_turn += a_diff * (50 / max(d, 1))
-        
-        # Simple Hazard Avoidance
-        if track:
-            for hazard in track.hazards:
-                h_dist = math.sqrt((self.x - hazard['x'])**2 + (self.y - hazard['y'])**2)
-                if h_dist < hazard['radius'] + 100:
-                    avoid_angle = math.degrees(math.atan2(self.x - hazard['x'], -(self.y - hazard['y'])))
-                    a_diff = (avoid_angle - self.angle + 180) % 360 - 180
-                    avoid_turn += a_diff * 2
+    # Rows whose centre is in (y_lo, y_hi]
+    r0 = np.searchsorted(cy, y_lo, 'right')
+    counts = np.maximum(np.searchsorted(cy, y_hi, 'right') - r0, 0)
+    edge = np.repeat(np.arange(len(p1)), counts)
+    row = np.repeat(r0, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
 
-        final_turn = diff + max(min(avoid_turn, 40), -40)
-
-        # Steering
-        if abs(final_turn) > 2:
-            turn_amt = min(abs(final_turn), self.turn_speed)
-            if final_turn > 0: self.angle += turn_amt
-            else: self.angle -= turn_amt
-        
-        # Throttle
-        target_speed = self.current_max_speed
-        if abs(diff) > 30: target_speed *= 0.6
-        if abs(diff) > 60: target_speed *= 0.4
-        
-        if self.speed < target_speed:
-            self.speed += self.acceleration
-        elif self.speed > target_speed:
-            self.speed -= 0.1
-            
-        rad = math.radians(self.angle)
-        self.x += self.speed * math.sin(rad)
-        self.y -= self.speed * math.cos(rad)
+    # Each crossing flips every cell at or left of it
+    y = cy[row]
+    p1x, p1y, p2x, p2y = p1[edge, 0], p1[edge, 1], p2[edge, 0], p2[edge, 1]
+    xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+    reach = np.searchsorted(cx, np.minimum(xinters, np.maximum(p1x, p2x)), 'right')
+    flips = np.zeros((len(cy), len(cx) + 1), dtype=np.int32)
+    np.add.at(flips, (row, 0), 1)
+    np.add.at(flips, (row, reach), -1)
+    return (np.cumsum(flips, axis=1)[:, :len(cx)] & 1).astype(bool)
 
 class Track:
-    def __init__(self):
+    def __init__(self, layout=None, cache_dir=None):
+        # layout: optional overrides for 'centerline', 'track_width', 'hazards', 'checkpoints';
+        # anything not overridden comes from the DEFAULT_TRACK file
+        # cache_dir: where baked geometry is stored/loaded (see load_track)
+        self.layout = dict(default_layout(), **(layout or {}))
+        self.cache_dir = cache_dir
         self.track_points = []
         self.checkpoints = []
         self.hazards = []
@@ -249,17 +1137,30 @@ class Track:
         self.create_track()
         
     def create_track(self):
-        self.centerline = [
-            (500, 400), (500, 600), (500, 800), # START
-            (550, 950), (700, 1050), (900, 1100), # TURN 1
-            (1100, 1080), (1300, 1000), (1500, 850), # STRAIGHT
-            (1600, 700), (1600, 500), # TURN 2
-            (1500, 350), (1300, 250), (1100, 200), (900, 200), (700, 200), # TOP CURVE
-            (600, 300), 
-        ]
-        
-        track_width = 130
-        
+        self.centerline = [tuple(p) for p in self.layout['centerline']]
+        self.track_width = self.layout.get('track_width', 130)
+
+        # Checkpoints
+        num_checkpoints = self.layout.get('checkpoints', 18)
+        for i in range(num_checkpoints):
+            idx = int((i / num_checkpoints) * len(self.centerline))
+            self.checkpoints.append({
+                'center': self.centerline[idx],
+                'idx': idx
+            })
+
+        self.hazards = [dict(h) for h in self.layout['hazards']]
+
+        # Derived geometry comes from the on-disk cache when there is one
+        if not self.load_cache():
+            self.build_edges()
+            self.bake()
+            self.save_cache()
+
+    def build_edges(self):
+        track_width = self.track_width
+        self.outer_points = []
+        self.inner_points = []
         for i in range(len(self.centerline)):
             curr = self.centerline[i]
             next_pt = self.centerline[(i + 1) % len(self.centerline)]
@@ -277,61 +1178,334 @@ class Track:
             
             self.outer_points.append((curr[0] + perp_x * track_width, curr[1] + perp_y * track_width))
             self.inner_points.append((curr[0] - perp_x * track_width, curr[1] - perp_y * track_width))
-        
-        # Checkpoints
-        num_checkpoints = 18
-        for i in range(num_checkpoints):
-            idx = int((i / num_checkpoints) * len(self.centerline))
-            self.checkpoints.append({
-                'center': self.centerline[idx],
-                'idx': idx
-            })
-        
-        # Hazards - UPDATED LOCATIONS (ON ROAD)
-        # Note: Centerline points are approx:
-        # Straight: (1300, 1000)
-        # Top Curve: (900, 200)
-        self.hazards = [
-            # Water on the grass (optional decoration)
-            {'x': 400, 'y': 1050, 'radius': 85, 'type': 'water'},
-            
-            # LAVA ON THE TRACK - Mid Straight
-            {'x': 1300, 'y': 1000, 'radius': 60, 'type': 'lava'},
-            
-            # WATER ON THE TRACK - Top Curve Apex
-            {'x': 1100, 'y': 200, 'radius': 55, 'type': 'water'},
-            
-            # LAVA ON THE TRACK - Before Finish
-            {'x': 650, 'y': 350, 'radius': 50, 'type': 'lava'},
-        ]
-        
+
+    def bake(self):
+        self.bake_arrays()
+        self.bake_arcs()
+        self.bake_surface()
+        self.bake_racing_line()
+        # Tiles are rendered lazily on the next draw
+        self.tiles = None
+        self.scaled_tiles = {}
+
+    def bake_arrays(self):
+        # Array views of checkpoints/hazards for the vectorised fleet rules
+        self.checkpoint_xy = np.array([cp['center'] for cp in self.checkpoints], dtype=np.float64)
+        self.hazard_xy = np.array([(h['x'], h['y']) for h in self.hazards], dtype=np.float64).reshape(-1, 2)
+        self.hazard_radius = np.array([h['radius'] for h in self.hazards], dtype=np.float64)
+
+        # Hazards never move, so their perception grid is built once here
+        self.hazard_reach = float(self.hazard_radius.max()) * HAZARD_HIT_SCALE + HAZARD_CLEARANCE if len(self.hazards) else HAZARD_CLEARANCE
+        self.hazard_grid = SpatialHash(self.hazard_reach)
+        self.hazard_grid.build(self.hazard_xy[:, 0], self.hazard_xy[:, 1])
+
+        # Centerline segments for race progress
+        pts = np.array(self.centerline, dtype=np.float64)
+        self.seg_a = pts
+        self.seg_vec = np.roll(pts, -1, axis=0) - pts
+
+        # Segment index: each box holds the road quad and its centerline, padded for kerb/shoulder lines
+        outer = np.array(self.outer_points, dtype=np.float64)
+        inner = np.array(self.inner_points, dtype=np.float64)
+        corners = np.stack([outer, np.roll(outer, -1, axis=0), inner, np.roll(inner, -1, axis=0),
+                            pts, np.roll(pts, -1, axis=0)], axis=1)
+        boxes = np.concatenate([corners.min(axis=1) - TILE_MARGIN, corners.max(axis=1) + TILE_MARGIN], axis=1)
+        self.segments = SegmentBVH(boxes, self.seg_a, self.seg_vec)
+
+    def bake_arcs(self):
+        # Cumulative arc length along the centerline
+        self.seg_len = np.hypot(self.seg_vec[:, 0], self.seg_vec[:, 1])
+        self.seg_len2 = np.maximum(self.seg_len**2, 1e-9)
+        cumulative = np.concatenate([[0.0], np.cumsum(self.seg_len)])
+        self.arc_start = cumulative[:-1]
+        self.lap_length = cumulative[-1]
+        self.checkpoint_s = self.arc_start[[cp['idx'] for cp in self.checkpoints]]
+        self.bake_window()
+
+    def bake_window(self):
+        # Segments searched around a kart's hint (see KartFleet.project): SEGMENT_WINDOW, or enough
+        # mean-length segments to cover HINT_REACH px ahead when the centerline is finely sampled
+        n = len(self.seg_len)
+        step = self.lap_length / n
+        ahead = min(max(SEGMENT_WINDOW[-1], math.ceil(HINT_REACH / step)), n // 2)
+        behind = min(max(-SEGMENT_WINDOW[0], math.ceil(HINT_REACH / 2 / step)), n // 2)
+        self.segment_window = np.arange(-behind, ahead + 1)
+
+    def bake_racing_line(self):
+        # Offline racing line: sample the centerline every RACING_LINE_STEP px, then relax
+        # lateral offsets toward the straightest path the road and hazards allow.
+        # Yields target points, their normals, a target-speed profile, each sample's centerline
+        # arc position (s) and the arc length along the line itself (arc; its last entry is the lap).
+        n = max(8, int(self.lap_length // RACING_LINE_STEP))
+        s = np.arange(n) * (self.lap_length / n)
+        seg = np.searchsorted(self.arc_start, s, side='right') - 1
+        t = (s - self.arc_start[seg]) / np.maximum(self.seg_len[seg], 1e-9)
+        cx = self.seg_a[seg, 0] + self.seg_vec[seg, 0] * t
+        cy = self.seg_a[seg, 1] + self.seg_vec[seg, 1] * t
+        # Same normal convention as the outer edge. Tangents come from a chord spanning k samples
+        # either side, so normals turn gradually through each corner: per-segment normals jump at
+        # the vertices, and an offset line on the inside of a corner then folds back on itself
+        k = 8
+        tx = np.roll(cx, -k) - np.roll(cx, k)
+        ty = np.roll(cy, -k) - np.roll(cy, k)
+        norm = np.maximum(np.hypot(tx, ty), 1e-9)
+        tx, ty = tx / norm, ty / norm
+        nx, ny = -ty, tx
+
+        limit = max(0.0, self.track_width - RACING_LINE_MARGIN)
+        offset = np.zeros(n)
+
+        # Each hazard blocks an interval of offsets at the samples it overlaps; pass on the roomier side
+        blocks = []
+        for h in self.hazards:
+            r = h['radius'] * HAZARD_HIT_SCALE + HAZARD_CLEARANCE + 40 * LANE_SCALE
+            hx = h['x'] - cx
+            hy = h['y'] - cy
+            along = hx * tx + hy * ty
+            across = hx * nx + hy * ny
+            near = (np.abs(along) < r) & (np.abs(across) < limit + r)
+            if not near.any():
+                continue
+            half = np.sqrt(np.maximum(r * r - along**2, 0.0))
+            pass_low = across[near][np.argmin(np.abs(along[near]))] >= 0
+            blocks.append((near, across - half, across + half, pass_low))
+
+        # Coarse-to-fine: wide neighbour strides pull the line across corners quickly,
+        # the final stride-1 passes smooth it locally
+        strides = [16, 8, 4, 2, 1]
+        for it in range(RACING_LINE_ITERATIONS):
+            stride = strides[it * len(strides) // RACING_LINE_ITERATIONS]
+            lx = cx + nx * offset
+            ly = cy + ny * offset
+            mx = (np.roll(lx, stride) + np.roll(lx, -stride)) / 2
+            my = (np.roll(ly, stride) + np.roll(ly, -stride)) / 2
+            offset = np.clip((mx - cx) * nx + (my - cy) * ny, -limit, limit)
+            for near, low, high, pass_low in blocks:
+                if pass_low:
+                    offset = np.where(near, np.minimum(offset, low), offset)
+                else:
+                    offset = np.where(near, np.maximum(offset, high), offset)
+                offset = np.clip(offset, -limit, limit)
+
+        lx = cx + nx * offset
+        ly = cy + ny * offset
+
+        # Cornering limit from curvature (Menger, over a chord about one lookahead long)
+        k = 6
+        ax, ay = np.roll(lx, k) - lx, np.roll(ly, k) - ly
+        bx, by = np.roll(lx, -k) - lx, np.roll(ly, -k) - ly
+        cross = np.abs(ax * by - ay * bx)
+        sides = np.hypot(ax, ay) * np.hypot(bx, by) * np.hypot(bx - ax, by - ay)
+        curvature = 2 * cross / np.maximum(sides, 1e-9)
+        speed = np.minimum(LINE_TURN_RATE / np.maximum(curvature, 1e-9), 99.0)
+
+        # Braking pass (twice round so it wraps over the start line)
+        ds = np.hypot(np.roll(lx, -1) - lx, np.roll(ly, -1) - ly)
+        for _ in range(2):
+            for i in range(n - 1, -1, -1):
+                j = (i + 1) % n
+                speed[i] = min(speed[i], math.sqrt(speed[j]**2 + 2 * LINE_BRAKE * ds[i]))
+
+        arc = np.concatenate([[0.0], np.cumsum(ds)])
+        self.racing_line = {'x': lx, 'y': ly, 'nx': nx, 'ny': ny, 'speed': speed, 's': s, 'arc': arc}
+
+    def save_cache(self):
+        if not self.cache_dir or os.path.isdir(self.cache_dir):
+            return
+        # Write into a temp dir and rename so readers never see a half-written cache
+        tmp = f"{self.cache_dir}.tmp{os.getpid()}"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            np.save(os.path.join(tmp, "edges.npy"), np.array([self.outer_points, self.inner_points], dtype=np.float64))
+            np.save(os.path.join(tmp, "arcs.npy"), np.array([self.arc_start, self.seg_len]))
+            np.save(os.path.join(tmp, "surface.npy"), self.surface)
+            np.savez(os.path.join(tmp, "racing_line.npz"), **self.racing_line)
+            with open(os.path.join(tmp, "meta.json"), 'w') as f:
+                json.dump({'surface_origin': self.surface_origin, 'lap_length': self.lap_length}, f)
+        except OSError:
+            # Read-only install (system package, frozen bundle): race without a cache
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        try:
+            os.replace(tmp, self.cache_dir)
+        except OSError:
+            # Another process baked the same track first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def load_cache(self):
+        if not self.cache_dir or not os.path.isfile(os.path.join(self.cache_dir, "meta.json")):
+            return False
+        with open(os.path.join(self.cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+        edges = np.load(os.path.join(self.cache_dir, "edges.npy"), mmap_mode='r')
+        self.outer_points = [tuple(p) for p in edges[0].tolist()]
+        self.inner_points = [tuple(p) for p in edges[1].tolist()]
+
+        self.bake_arrays()
+        arcs = np.load(os.path.join(self.cache_dir, "arcs.npy"), mmap_mode='r')
+        self.arc_start = np.array(arcs[0])
+        self.seg_len = np.array(arcs[1])
+        self.seg_len2 = np.maximum(self.seg_len**2, 1e-9)
+        self.lap_length = meta['lap_length']
+        self.checkpoint_s = self.arc_start[[cp['idx'] for cp in self.checkpoints]]
+        self.bake_window()
+
+        grid = np.load(os.path.join(self.cache_dir, "surface.npy"), mmap_mode='r')
+        self.surface = grid
+        self.surface_origin = tuple(meta['surface_origin'])
+        self.surface_bytes = grid.tobytes()
+        self.surface_h, self.surface_w = grid.shape
+
+        with np.load(os.path.join(self.cache_dir, "racing_line.npz")) as line:
+            self.racing_line = {name: line[name] for name in line.files}
+        self.tiles = None
+        self.scaled_tiles = {}
+        return True
+
+    def bake_surface(self):
+        # Rasterise road + hazards once so per-kart queries are a single index.
+        # Call again whenever centerline/edges/hazards change.
+        xs = [p[0] for p in self.outer_points + self.inner_points]
+        ys = [p[1] for p in self.outer_points + self.inner_points]
+        for h in self.hazards:
+            xs += [h['x'] - h['radius'], h['x'] + h['radius']]
+            ys += [h['y'] - h['radius'], h['y'] + h['radius']]
+        ox = math.floor(min(xs)) - SURFACE_CELL
+        oy = math.floor(min(ys)) - SURFACE_CELL
+        w = int((max(xs) - ox) // SURFACE_CELL) + 2
+        h = int((max(ys) - oy) // SURFACE_CELL) + 2
+
+        # Sample at cell centres
+        cx = ox + (np.arange(w) + 0.5) * SURFACE_CELL
+        cy = oy + (np.arange(h) + 0.5) * SURFACE_CELL
+
+        road = poly_raster(cx, cy, self.outer_points) & ~poly_raster(cx, cy, self.inner_points)
+        grid = np.where(road, SURFACE_ROAD, SURFACE_GRASS).astype(np.uint8)
+
+        for haz in self.hazards:
+            r = haz['radius'] * HAZARD_HIT_SCALE
+            hit = (cx[None, :] - haz['x'])**2 + (cy[:, None] - haz['y'])**2 < r * r
+            grid[hit] |= SURFACE_WATER if haz['type'] == 'water' else SURFACE_LAVA
+
+        self.surface = grid
+        self.surface_origin = (ox, oy)
+        # bytes indexing hands back a plain int, much cheaper than a numpy scalar
+        self.surface_bytes = grid.tobytes()
+        self.surface_w = w
+        self.surface_h = h
+
+    def surface_at(self, x, y):
+        gx = int((x - self.surface_origin[0]) // SURFACE_CELL)
+        gy = int((y - self.surface_origin[1]) // SURFACE_CELL)
+        if 0 <= gx < self.surface_w and 0 <= gy < self.surface_h:
+            return self.surface_bytes[gy * self.surface_w + gx]
+        return SURFACE_GRASS
+
+    def surface_at_many(self, xs, ys):
+        # Batch lookup for arrays of kart positions
+        gx = np.floor((np.asarray(xs, dtype=np.float64) - self.surface_origin[0]) / SURFACE_CELL).astype(np.int64)
+        gy = np.floor((np.asarray(ys, dtype=np.float64) - self.surface_origin[1]) / SURFACE_CELL).astype(np.int64)
+        inside = (gx >= 0) & (gx < self.surface_w) & (gy >= 0) & (gy < self.surface_h)
+        out = np.zeros(gx.shape, dtype=np.uint8)
+        out[inside] = self.surface[gy[inside], gx[inside]]
+        return out
+
     def is_on_road(self, x, y):
-        def point_in_poly(x, y, poly):
-            n = len(poly)
-            inside = False
-            p1x, p1y = poly[0]
-            for i in range(n + 1):
-                p2x, p2y = poly[i % n]
-                if y > min(p1y, p2y):
-                    if y <= max(p1y, p2y):
-                        if x <= max(p1x, p2x):
-                            if p1y != p2y:
-                                xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                            if p1x == p2x or x <= xinters:
-                                inside = not inside
-                p1x, p1y = p2x, p2y
-            return inside
-        return point_in_poly(x, y, self.outer_points) and not point_in_poly(x, y, self.inner_points)
+        return bool(self.surface_at(x, y) & SURFACE_ROAD)
     
-    def draw(self, screen, camera_x, camera_y):
-        # 1. Background
-        screen.fill(GRASS_LIGHT)
-        
-        # 2. Track Segments
+    def build_tiles(self):
+        # Pre-render the static track into TRACK_TILE chunks covering its bounds
+        xs = [p[0] for p in self.outer_points + self.inner_points]
+        ys = [p[1] for p in self.outer_points + self.inner_points]
+        for h in self.hazards:
+            xs += [h['x'] - h['radius'] - 5, h['x'] + h['radius'] + 5]
+            ys += [h['y'] - h['radius'] - 5, h['y'] + h['radius'] + 5]
+        tx0 = int((min(xs) - TILE_MARGIN) // TRACK_TILE)
+        tx1 = int((max(xs) + TILE_MARGIN) // TRACK_TILE)
+        ty0 = int((min(ys) - TILE_MARGIN) // TRACK_TILE)
+        ty1 = int((max(ys) + TILE_MARGIN) // TRACK_TILE)
+
+        display_ready = pygame.display.get_surface() is not None
+        if self.load_tiles(display_ready):
+            return
+        self.tiles = {}
+        for tx in range(tx0, tx1 + 1):
+            for ty in range(ty0, ty1 + 1):
+                tile = pygame.Surface((TRACK_TILE, TRACK_TILE))
+                tile.fill(GRASS_LIGHT)
+                self.draw_static(tile, tx * TRACK_TILE, ty * TRACK_TILE)
+                self.tiles[(tx, ty)] = tile.convert() if display_ready else tile
+        self.save_tiles()
+
+    def save_tiles(self):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        keys = list(self.tiles)
+        pixels = np.array([np.frombuffer(pygame.image.tobytes(self.tiles[k], 'RGB'), dtype=np.uint8) for k in keys])
+        tmp = os.path.join(self.cache_dir, f"tiles.tmp{os.getpid()}.npy")
+        try:
+            np.save(tmp, pixels)
+            np.save(os.path.join(self.cache_dir, "tile_keys.npy"), np.array(keys, dtype=np.int64))
+            os.replace(tmp, os.path.join(self.cache_dir, "tiles.npy"))
+        except OSError:
+            # Cache dir not writable: the tiles are rendered again next time
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def load_tiles(self, display_ready):
+        if not self.cache_dir or not os.path.isfile(os.path.join(self.cache_dir, "tiles.npy")):
+            return False
+        keys = np.load(os.path.join(self.cache_dir, "tile_keys.npy"))
+        pixels = np.load(os.path.join(self.cache_dir, "tiles.npy"), mmap_mode='r')
+        self.tiles = {}
+        for (tx, ty), raw in zip(keys.tolist(), pixels):
+            tile = pygame.image.frombuffer(raw, (TRACK_TILE, TRACK_TILE), 'RGB')
+            self.tiles[(tx, ty)] = tile.convert() if display_ready else tile.copy()
+        return True
+
+    def tiles_at(self, scale):
+        # Tile atlas at a reduced render resolution, downsampled on first use
+        if self.tiles is None:
+            self.build_tiles()
+        if scale == 1:
+            return self.tiles
+        tiles = self.scaled_tiles.get(scale)
+        if tiles is None:
+            size = int(TRACK_TILE * scale)
+            tiles = self.scaled_tiles[scale] = {key: pygame.transform.smoothscale(tile, (size, size))
+                                                for key, tile in self.tiles.items()}
+        return tiles
+
+    def draw(self, screen, camera_x, camera_y, scale=1):
+        # scale: render resolution; the camera is in scaled pixels
+        tiles = self.tiles_at(scale)
+        size = int(TRACK_TILE * scale)
+
+        # Cached track tiles overlapping the viewport
+        sw, sh = screen.get_size()
+        blits = []
+        covered = True
+        for tx in range(camera_x // size, (camera_x + sw - 1) // size + 1):
+            for ty in range(camera_y // size, (camera_y + sh - 1) // size + 1):
+                tile = tiles.get((tx, ty))
+                if tile:
+                    blits.append((tile, (tx * size - camera_x, ty * size - camera_y)))
+                else:
+                    covered = False
+
+        # Background only shows where there is no tile
+        if not covered:
+            screen.fill(GRASS_LIGHT)
+        screen.blits(blits, doreturn=False)
+
+    def draw_static(self, screen, camera_x, camera_y):
+        # Track Segments (only those overlapping the target surface)
         N = len(self.centerline)
+        sw, sh = screen.get_size()
+        visible = self.segments.query_rect(camera_x, camera_y, camera_x + sw, camera_y + sh).tolist()
         
         # Dirt Shoulder
-        for i in range(N):
+        for i in visible:
             next_i = (i + 1) % N
             p1_out = (self.outer_points[i][0] - camera_x, self.outer_points[i][1] - camera_y)
             p2_out = (self.outer_points[next_i][0] - camera_x, self.outer_points[next_i][1] - camera_y)
@@ -340,7 +1514,7 @@ class Track:
             pygame.draw.polygon(screen, DIRT, [p1_out, p2_out, p2_in, p1_in], width=10)
 
         # Asphalt Road
-        for i in range(N):
+        for i in visible:
             next_i = (i + 1) % N
             p1_out = (self.outer_points[i][0] - camera_x, self.outer_points[i][1] - camera_y)
             p2_out = (self.outer_points[next_i][0] - camera_x, self.outer_points[next_i][1] - camera_y)
@@ -353,7 +1527,7 @@ class Track:
             pygame.draw.line(screen, kerb_color, p1_out, p2_out, 8)
             pygame.draw.line(screen, kerb_color, p1_in, p2_in, 8)
             
-        # 3. Start/Finish Line - DRAWN EXPLICITLY ON INDEX 0
+        # Start/Finish Line - DRAWN EXPLICITLY ON INDEX 0
         # This matches the logical starting checkpoint exactly
         sx_out, sy_out = self.outer_points[0]
         sx_in, sy_in = self.inner_points[0]
@@ -370,7 +1544,7 @@ class Track:
             col = WHITE if j % 2 == 0 else BLACK
             pygame.draw.polygon(screen, col, [(lx1, ly1), (lx2, ly2), (lx2+4, ly2), (lx1+4, ly1)])
 
-        # 4. Hazards
+        # Hazards
         for hazard in self.hazards:
             x = int(hazard['x'] - camera_x)
             y = int(hazard['y'] - camera_y)
@@ -385,73 +1559,795 @@ class Track:
                 pygame.draw.circle(screen, LAVA_MAIN, (x, y), r)
                 pygame.draw.circle(screen, LAVA_CORE, (x, y), int(r * 0.7))
 
+AI_COLORS = [(30, 144, 255), (255, 140, 0), (128, 0, 128)]
+PLAYER_COLOR = (220, 20, 60)
+PLAYER_COLORS = [PLAYER_COLOR, (50, 205, 50), (255, 215, 0), (0, 206, 209), (255, 105, 180)]
+
+class FrameProfiler:
+    # Per-phase frame timings. Each mark() closes the phase that started at the
+    # previous mark; while disabled every call returns straight away.
+    def __init__(self, history=PROFILER_HISTORY, trace_frames=TRACE_MAX_FRAMES):
+        self.enabled = False
+        self.current = None
+        self.frame_start = 0
+        self.last = 0
+        self.origin = time.perf_counter_ns()
+        self.history = deque(maxlen=history)
+        self.trace = deque(maxlen=trace_frames)
+        self.labels = []
+        self.frame_count = 0  # frames recorded; history stops growing once full
+        self.graph = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame_start = self.last = time.perf_counter_ns()
+        self.current = []
+
+    def mark(self, name):
+        if self.current is None:
+            return
+        now = time.perf_counter_ns()
+        self.current.append((name, self.last, now - self.last))
+        self.last = now
+
+    def end_frame(self):
+        if self.current is None:
+            return
+        total = time.perf_counter_ns() - self.frame_start
+        self.history.append((total, self.current))
+        self.trace.append((self.frame_start, total, self.current))
+        self.frame_count += 1
+        self.current = None
+
+    def averages(self, frames=60):
+        # Mean ms per phase over the most recent frames
+        recent = list(self.history)[-frames:]
+        sums = {}
+        for _, phases in recent:
+            for name, _, dur in phases:
+                sums[name] = sums.get(name, 0) + dur
+        n = max(1, len(recent))
+        return {name: total / n / 1e6 for name, total in sums.items()}
+
+    def write_trace(self, path=TRACE_FILE):
+        # Chrome trace format (chrome://tracing, Perfetto); timestamps in microseconds
+        events = []
+        for start, total, phases in self.trace:
+            events.append({'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0,
+                           'ts': (start - self.origin) / 1000, 'dur': total / 1000})
+            for name, t0, dur in phases:
+                events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                               'ts': (t0 - self.origin) / 1000, 'dur': dur / 1000})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(self.trace)
+
+    def draw(self, screen, font):
+        # Stacked per-phase bars for recent frames against the 60 FPS budget
+        w, h = self.history.maxlen, 100
+        x0 = screen.get_width() - w - 20
+        y0 = 20
+        pygame.draw.rect(screen, UI_BG, (x0 - 10, y0 - 10, w + 20, h + 20 + 18 * len(self.labels)))
+        scale = h / (2 * 1000.0 / FPS)  # graph height is two frame budgets
+
+        # The graph scrolls one column per frame; only the newest frame is drawn
+        if self.graph is None:
+            self.graph = pygame.Surface((w, h))
+            self.graph.fill(UI_BG)
+        if self.history:
+            self.graph.scroll(-1, 0)
+            pygame.draw.line(self.graph, UI_BG, (w - 1, 0), (w - 1, h))
+            y = h
+            for name, _, dur in self.history[-1][1]:
+                bar = dur / 1e6 * scale
+                pygame.draw.line(self.graph, PHASE_COLORS.get(name, WHITE), (w - 1, y), (w - 1, y - bar))
+                y -= bar
+        screen.blit(self.graph, (x0, y0))
+        budget_y = y0 + h - (1000.0 / FPS) * scale
+        pygame.draw.line(screen, RED_KERB, (x0, budget_y), (x0 + w, budget_y))
+
+        # Breakdown text is re-rendered twice a second, not every frame
+        if not self.labels or self.frame_count % (FPS // 2) == 0:
+            self.labels = [
+                (font.render(name, True, PHASE_COLORS.get(name, WHITE)), font.render(f"{ms:.2f} ms", True, WHITE))
+                for name, ms in self.averages().items()
+            ]
+        y = y0 + h + 8
+        for name_label, ms_label in self.labels:
+            screen.blit(name_label, (x0, y))
+            screen.blit(ms_label, (x0 + w - ms_label.get_width(), y))
+            y += 18
+
+class QualityGovernor:
+    # Picks a QUALITY_LEVELS entry from recent frame work times (excluding the frame-cap sleep).
+    # Drops quickly when over budget, climbs back slowly so it doesn't oscillate. A drop that doesn't
+    # help moves on to the next level; if even the cheapest one allowed isn't cheaper than where the drops
+    # started (frames not bound by rendering), they are all undone and skipped for a while.
+    def __init__(self, levels=QUALITY_LEVELS, budget_ms=FRAME_BUDGET_MS):
+        self.levels = levels
+        self.budget_ms = budget_ms
+        self.level = 0
+        self.max_level = len(levels) - 1
+        self.samples = deque(maxlen=GOVERNOR_WINDOW)
+        self.calm_windows = 0
+        self.descent = None  # (level, mean) where the current run of drops started
+        self.retry_windows = 0
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def update(self, frame_ms):
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.samples.maxlen:
+            return
+        mean = sum(self.samples) / len(self.samples)
+        self.samples.clear()
+        if self.retry_windows:
+            self.retry_windows -= 1
+            if not self.retry_windows:
+                self.max_level = len(self.levels) - 1
+        if mean > self.budget_ms * GOVERNOR_DROP:
+            self.calm_windows = 0
+            if self.level < self.max_level:
+                if self.descent is None:
+                    self.descent = (self.level, mean)
+                self.level += 1
+            elif self.descent is not None:
+                start, before = self.descent
+                self.descent = None
+                if mean > before * GOVERNOR_MIN_GAIN:
+                    self.level = self.max_level = start
+                    self.retry_windows = GOVERNOR_RETRY_WINDOWS
+        elif mean < self.budget_ms * GOVERNOR_RAISE:
+            self.descent = None
+            self.calm_windows += 1
+            if self.calm_windows >= GOVERNOR_RAISE_WINDOWS:
+                self.calm_windows = 0
+                self.level = max(self.level - 1, 0)
+        else:
+            self.descent = None
+            self.calm_windows = 0
+
+class RaceSimulation:
+    # Headless race core: no window, no clock, no drawing.
+    # Game drives it once per frame; batch tools call run() directly.
+    def __init__(self, track, total_laps=3, num_ai=3, with_player=True, seed=None, ai_params=None,
+                 profiler=None, num_players=None, ai_lod=True):
+        self.track = track
+        self.profiler = profiler or FrameProfiler()
+        self.total_laps = total_laps
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.game_time = 0
+        self.tick = 0
+        self.hazard_hits = []
+        self.checkpoint_hits = np.zeros(0, dtype=np.int64)
+        self.telemetry = None  # TelemetryRecorder fed once per tick
+
+        # Grid: players at the front, then rows back along the track behind the start line.
+        # num_players > 1 is for networked races, each player kart driven by its own controls
+        if num_players is None:
+            num_players = 1 if with_player else 0
+        self.fleet = KartFleet()
+        # Only races with a player have a camera to cut AI detail around
+        self.fleet.lod = ai_lod
+        self.players = []
+        self.ai_karts = []
+        for i in range(num_players):
+            self.players.append(Kart(0, 0, PLAYER_COLORS[i % len(PLAYER_COLORS)], is_player=True, fleet=self.fleet))
+        self.player = self.players[0] if self.players else None
+        for i in range(num_ai):
+            ai = AIKart(0, 0, AI_COLORS[i % len(AI_COLORS)], track.centerline, rng=self.rng, fleet=self.fleet)
+            for key, value in (ai_params or {}).items():
+                setattr(ai, key, value)
+            self.ai_karts.append(ai)
+
+        self.all_karts = self.players + self.ai_karts
+        lanes, row = self.grid_shape(track, len(self.all_karts))
+        clearance = min(GRID_CLEARANCE, row)
+        slot = 0
+        for i, k in enumerate(self.all_karts):
+            # Slots that land in a hazard, or that a corner squeezes onto a kart already placed, are
+            # left empty, until the grid has gone a whole lap back and there is nowhere else to go
+            while True:
+                x, y, angle, seg = self.grid_slot(track, slot, lanes, row)
+                back = self.grid_back(slot, lanes, row)
+                full = (slot // lanes + 1) * row >= track.lap_length
+                slot += 1
+                clear = np.hypot(self.fleet.x[:i] - x, self.fleet.y[:i] - y).min(initial=np.inf) >= clearance
+                if full or (clear and not track.surface_at(x, y) & SURFACE_HAZARD):
+                    break
+            k.x, k.y, k.angle, k.seg_hint = x, y, angle, seg
+            # Karts behind the line have not started lap 1 yet: lap 0 (or below, for a grid longer
+            # than a lap) from the checkpoint behind them, so their progress stays negative until they cross it
+            k.current_lap = int(-back // track.lap_length) + 1
+            k.last_checkpoint = int(np.searchsorted(track.checkpoint_s, -back % track.lap_length, side='right')) - 1
+
+    @staticmethod
+    def grid_shape(track, karts):
+        # (lanes, px between rows): two lanes for small fields, bigger ones widen the grid as far
+        # as the road allows; a field that still would not fit in a lap gets its rows packed closer
+        fit = int(2 * (track.track_width - KART_WIDTH) // GRID_LANE) + 1
+        lanes = max(2, min(fit, -(-karts // GRID_ROWS)))
+        rows = -(-karts // lanes)
+        return lanes, min(GRID_ROW, track.lap_length * GRID_SPAN / rows)
+
+    @staticmethod
+    def grid_back(slot, lanes=2, row_px=GRID_ROW):
+        # px of track between a grid slot and the start line: rows going back from the line,
+        # each lane staggered a little further back than the one before it
+        row, lane = divmod(slot, lanes)
+        return (row + lane / lanes) * row_px
+
+    @staticmethod
+    def grid_slot(track, slot, lanes=2, row_px=GRID_ROW):
+        # (x, y, angle, segment) of a grid slot, grid_back px behind the start line
+        lane = slot % lanes
+        s = -RaceSimulation.grid_back(slot, lanes, row_px) % track.lap_length
+        seg = int(np.searchsorted(track.arc_start, s, side='right')) - 1
+        tx, ty = track.seg_vec[seg] / track.seg_len[seg]
+        t = (s - track.arc_start[seg]) / track.seg_len[seg]
+        across = (lane - (lanes - 1) / 2) * GRID_LANE
+        x = track.seg_a[seg, 0] + track.seg_vec[seg, 0] * t - ty * across
+        y = track.seg_a[seg, 1] + track.seg_vec[seg, 1] * t + tx * across
+        return float(x), float(y), math.degrees(math.atan2(tx, -ty)), seg
+
+    def step(self, keys=None, dt=SIM_DT):
+        self.game_time += dt
+        self.tick += 1
+
+        # Update ALL karts (Player brakes if finished, AI keeps going)
+        self.fleet.step(keys, self.track)
+        self.profiler.mark('physics')
+        self.fleet.collide()
+        self.profiler.mark('collisions')
+        self.check_hazards()
+        self.profiler.mark('hazards')
+
+        # Check Checkpoints & Laps
+        self.checkpoint_hits = self.fleet.check_checkpoints(self.track.checkpoint_xy, self.total_laps, self.game_time)
+        self.profiler.mark('checkpoints')
+
+        self.update_positions()
+        self.profiler.mark('positions')
+
+        if self.telemetry:
+            self.telemetry.record()
+            self.profiler.mark('telemetry')
+
+    def check_hazards(self):
+        fleet = self.fleet
+        surface = self.track.surface_at_many(fleet.x, fleet.y)
+        # Invincibility after a respawn covers hazards too: some checkpoints sit inside a pool
+        hit = ((surface & SURFACE_HAZARD) != 0) & ~fleet.finished & (fleet.invincible_timer == 0)
+        # (kart, x, y, surface bits) of this tick's hits, for effects; positions are before the respawn
+        self.hazard_hits = []
+        for i in np.nonzero(hit)[0]:
+            self.hazard_hits.append((int(i), float(fleet.x[i]), float(fleet.y[i]), int(surface[i])))
+            fleet.karts[i].respawn(self.track.checkpoints)
+
+    def check_checkpoints(self, kart):
+        kart.fleet.check_checkpoints(self.track.checkpoint_xy, self.total_laps, self.game_time,
+                                     sel=np.array([kart.idx]))
+
+    def update_positions(self):
+        self.fleet.update_positions(self.track)
+
+    def all_finished(self):
+        return bool(self.fleet.finished.all())
+
+    def run(self, max_time=600):
+        # Step as fast as the CPU allows until every kart is home or time runs out
+        max_ticks = int(max_time / SIM_DT)
+        while not self.all_finished() and self.tick < max_ticks:
+            self.step()
+        return self.results()
+
+    def results(self):
+        return {
+            'seed': self.seed,
+            'ticks': self.tick,
+            'time': self.game_time,
+            'karts': [
+                {
+                    'is_player': k.is_player,
+                    'finished': k.finished,
+                    'finish_time': k.finish_time if k.finished else None,
+                    'position': k.position,
+                    'lap': k.current_lap,
+                    'respawns': k.respawns,
+                }
+                for k in self.all_karts
+            ],
+        }
+
+_default_layout = None
+
+def default_layout():
+    # The DEFAULT_TRACK file is the one copy of the built-in track; read once per process
+    global _default_layout
+    if _default_layout is None:
+        with open(DEFAULT_TRACK) as f:
+            _default_layout = json.load(f)
+    return _default_layout
+
+def load_track(path, overrides=None):
+    # Track from a JSON file; baked geometry is cached under <dir>/.cache/<hash>,
+    # keyed by the file bytes, the overrides and the constants that shape the bake
+    with open(path, 'rb') as f:
+        raw = f.read()
+    layout = json.loads(raw)
+    layout.update(overrides or {})
+    digest = hashlib.sha256(raw)
+    digest.update(json.dumps([overrides or {}, TRACK_CACHE_VERSION, SURFACE_CELL, HAZARD_HIT_SCALE,
+                              TRACK_TILE, TILE_MARGIN, RACING_LINE_STEP, RACING_LINE_ITERATIONS,
+                              RACING_LINE_MARGIN, HAZARD_CLEARANCE, LINE_TURN_RATE, LINE_BRAKE, LANE_SCALE],
+                             sort_keys=True).encode())
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), TRACK_CACHE_DIR, digest.hexdigest()[:32])
+    return Track(layout, cache_dir=cache_dir)
+
+def run_batch(num_races, num_ai=4, total_laps=3, seed=0, ai_params=None, max_time=600, layout=None):
+    # AI-vs-AI races back to back; one shared Track since it is read-only
+    track = load_track(DEFAULT_TRACK, layout)
+    results = []
+    for i in range(num_races):
+        sim = RaceSimulation(track, total_laps, num_ai=num_ai, with_player=False,
+                             seed=seed + i, ai_params=ai_params)
+        results.append(sim.run(max_time))
+    return results
+
+# Replay files: fixed header, one 4-byte entry per kart (colour + player flag),
+# then one fixed-width record per sim tick so any tick is a direct offset
+REPLAY_MAGIC = b'ASIREPL1'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<8sIIqdI')  # magic, version, karts, seed, sim dt, laps
+REPLAY_KART = struct.Struct('<BBBB')       # r, g, b, is_player
+REPLAY_CHUNK = 600  # ticks buffered in memory between writes
+REPLAY_DIR = "replays"
+REPLAY_SEEK = 5.0  # seconds skipped per arrow key in playback
+KART_RECORD = np.dtype([
+    ('x', '<f4'), ('y', '<f4'), ('angle', '<f4'), ('speed', '<f4'),
+    ('lap', '<u2'), ('checkpoint', '<u2'), ('finished', 'u1'), ('invincible', 'u1'),
+])
+
+def replay_dtype(num_karts):
+    return np.dtype([('time', '<f8'), ('karts', KART_RECORD, (num_karts,))])
+
+class ReplayRecorder:
+    # Appends one record per sim tick; ticks are batched in a preallocated
+    # array and written a chunk at a time
+    def __init__(self, path, sim):
+        self.file = open(path, 'wb')
+        self.fleet = sim.fleet
+        self.file.write(REPLAY_HEADER.pack(
+            REPLAY_MAGIC, REPLAY_VERSION, len(sim.fleet),
+            -1 if sim.seed is None else sim.seed, SIM_DT, sim.total_laps,
+        ))
+        for k in sim.fleet.karts:
+            self.file.write(REPLAY_KART.pack(*k.color, int(k.is_player)))
+        self.buffer = np.zeros(REPLAY_CHUNK, dtype=replay_dtype(len(sim.fleet)))
+        self.count = 0
+
+    def record(self, game_time):
+        fleet = self.fleet
+        rec = self.buffer[self.count]
+        rec['time'] = game_time
+        karts = rec['karts']
+        karts['x'] = fleet.x
+        karts['y'] = fleet.y
+        karts['angle'] = fleet.angle
+        karts['speed'] = fleet.speed
+        karts['lap'] = fleet.current_lap
+        karts['checkpoint'] = fleet.last_checkpoint
+        karts['finished'] = fleet.finished
+        karts['invincible'] = np.minimum(fleet.invincible_timer, 255)
+        self.count += 1
+        if self.count == REPLAY_CHUNK:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.count].tobytes())
+        self.count = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+class Replay:
+    # Memory-mapped reader: records[tick] is a direct lookup, nothing is decoded up front
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            head = f.read(REPLAY_HEADER.size)
+            magic, version, num_karts, seed, sim_dt, total_laps = REPLAY_HEADER.unpack(head)
+            if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+                raise ValueError(f"{path} is not an ASI KART replay (v{REPLAY_VERSION})")
+            karts = [REPLAY_KART.unpack(f.read(REPLAY_KART.size)) for _ in range(num_karts)]
+        self.seed = None if seed < 0 else seed
+        self.sim_dt = sim_dt
+        self.total_laps = total_laps
+        self.colors = [k[:3] for k in karts]
+        self.is_player = [bool(k[3]) for k in karts]
+        offset = REPLAY_HEADER.size + REPLAY_KART.size * num_karts
+        self.records = np.memmap(path, dtype=replay_dtype(num_karts), mode='r', offset=offset)
+
+    def __len__(self):
+        return len(self.records)
+
+    def tick_at(self, t):
+        # Ticks are fixed-rate, so a time maps straight to a record index
+        return max(0, min(len(self) - 1, int(t / self.sim_dt)))
+
+    def apply(self, tick, fleet):
+        # Pose a fleet of display karts at the given tick
+        karts = self.records[tick]['karts']
+        fleet.x[:] = karts['x']
+        fleet.y[:] = karts['y']
+        fleet.angle[:] = karts['angle']
+        fleet.speed[:] = karts['speed']
+        fleet.current_lap[:] = karts['lap']
+        fleet.last_checkpoint[:] = karts['checkpoint']
+        fleet.finished[:] = karts['finished'] != 0
+        fleet.invincible_timer[:] = karts['invincible']
+        return float(self.records[tick]['time'])
+
+# Telemetry files: fixed header, then batches of rows from either stream. A batch is
+# (stream, rows) followed by each column's values back to back, so columns load as plain arrays
+TELEMETRY_MAGIC = b'ASITELE1'
+TELEMETRY_VERSION = 1
+TELEMETRY_HEADER = struct.Struct('<8sIIqdI')  # magic, version, karts, seed, sim dt, laps
+TELEMETRY_BATCH = struct.Struct('<BI')        # stream index, rows
+TELEMETRY_CHUNK = 4096  # rows per batch
+TELEMETRY_SLOTS = 8  # chunks per stream; when the writer falls this far behind, new rows are dropped
+TELEMETRY_DIR = "telemetry"
+EVENT_SPLIT = 0    # reached a checkpoint; value is the time since the previous one
+EVENT_LAP = 1      # crossed the line; value is the lap time, offroad the seconds spent off the road
+EVENT_RESPAWN = 2  # hit a hazard; surface is its SURFACE_* bits, checkpoint the respawn point
+EVENT_FINISH = 3   # finished the race; value is the finish time
+TELEMETRY_EVENT = np.dtype([
+    ('time', '<f8'), ('kart', '<u2'), ('kind', 'u1'), ('surface', 'u1'), ('lap', '<u2'),
+    ('checkpoint', '<u2'), ('value', '<f4'), ('offroad', '<f4'), ('x', '<f4'), ('y', '<f4'),
+])
+# One row per racing kart per tick
+TELEMETRY_SAMPLE = np.dtype([
+    ('time', '<f8'), ('kart', '<u2'), ('lap', '<u2'), ('speed', '<f4'), ('progress', '<f4'),
+    ('x', '<f4'), ('y', '<f4'), ('on_road', 'u1'),
+])
+TELEMETRY_STREAMS = [('events', TELEMETRY_EVENT), ('samples', TELEMETRY_SAMPLE)]
+
+class TelemetryRing:
+    # Preallocated chunks for one stream. The sim fills one chunk at a time and queues it for
+    # the writer when full; if no chunk has come back free, its rows are dropped and counted
+    # instead, so recording never waits on the disk
+    def __init__(self, stream, dtype, pending, chunk=TELEMETRY_CHUNK, slots=TELEMETRY_SLOTS):
+        self.stream = stream
+        self.chunks = np.zeros((slots, chunk), dtype=dtype)
+        self.pending = pending
+        self.free = queue.SimpleQueue()
+        for slot in range(1, slots):
+            self.free.put(slot)
+        self.slot = 0
+        self.count = 0
+        self.dropped = 0
+
+    def append(self, rows, **columns):
+        # columns: one array of `rows` values or a single value per field; unset fields are zero
+        done = 0
+        while done < rows:
+            chunk = self.chunks[self.slot]
+            take = min(rows - done, len(chunk) - self.count)
+            part = chunk[self.count:self.count + take]
+            part[:] = 0
+            for name, values in columns.items():
+                part[name] = values if np.ndim(values) == 0 else values[done:done + take]
+            self.count += take
+            done += take
+            if self.count == len(chunk):
+                self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += self.count
+            self.count = 0
+            return
+        self.pending.put((self, self.slot, self.count))
+        self.slot = slot
+        self.count = 0
+
+class TelemetryRecorder:
+    # Checkpoint splits, lap times, respawns and per-tick kart samples of one race.
+    # record() runs after each sim tick and only copies into the rings; a background
+    # thread does all the file writes
+    def __init__(self, path, sim):
+        self.sim = sim
+        self.file = open(path, 'wb')
+        self.file.write(TELEMETRY_HEADER.pack(
+            TELEMETRY_MAGIC, TELEMETRY_VERSION, len(sim.fleet),
+            -1 if sim.seed is None else sim.seed, SIM_DT, sim.total_laps,
+        ))
+        self.pending = queue.SimpleQueue()
+        self.rings = [TelemetryRing(i, dtype, self.pending) for i, (_, dtype) in enumerate(TELEMETRY_STREAMS)]
+        self.events, self.samples = self.rings
+
+        # Per kart: when its current split and lap started, and seconds off-road this lap
+        n = len(sim.fleet)
+        self.split_start = np.zeros(n)
+        self.lap_start = np.zeros(n)
+        self.offroad = np.zeros(n)
+        self.time = sim.game_time
+
+        self.writer = threading.Thread(target=self.write_batches, daemon=True)
+        self.writer.start()
+
+    @property
+    def dropped(self):
+        return sum(ring.dropped for ring in self.rings)
+
+    def record(self):
+        sim = self.sim
+        fleet = sim.fleet
+        t = sim.game_time
+        racing = np.nonzero(~fleet.finished)[0]
+        self.offroad[racing] += (t - self.time) * ~fleet.on_road[racing]
+        self.time = t
+
+        for i, x, y, surface in sim.hazard_hits:
+            self.events.append(1, time=t, kart=i, kind=EVENT_RESPAWN, surface=surface,
+                               lap=fleet.current_lap[i], checkpoint=fleet.last_checkpoint[i], x=x, y=y)
+
+        passed = sim.checkpoint_hits
+        if len(passed):
+            cp = fleet.last_checkpoint[passed]
+            line = cp == 0
+            # Checkpoint 0 is the line: its split closes the lap that was just completed
+            lap = fleet.current_lap[passed] - line
+            self.events.append(len(passed), time=t, kart=passed, kind=EVENT_SPLIT, lap=lap, checkpoint=cp,
+                               value=t - self.split_start[passed], x=fleet.x[passed], y=fleet.y[passed])
+            self.split_start[passed] = t
+
+            lapped = passed[line]
+            if len(lapped):
+                # Lap 0 is the run-up from a grid slot behind the line, not a timed lap
+                timed = lapped[lap[line] > 0]
+                self.events.append(len(timed), time=t, kart=timed, kind=EVENT_LAP, lap=fleet.current_lap[timed] - 1,
+                                   value=t - self.lap_start[timed], offroad=self.offroad[timed],
+                                   x=fleet.x[timed], y=fleet.y[timed])
+                self.lap_start[lapped] = t
+                self.offroad[lapped] = 0
+                done = lapped[fleet.finished[lapped]]
+                self.events.append(len(done), time=t, kart=done, kind=EVENT_FINISH, lap=sim.total_laps,
+                                   value=fleet.finish_time[done], x=fleet.x[done], y=fleet.y[done])
+
+        self.samples.append(len(racing), time=t, kart=racing, lap=fleet.current_lap[racing],
+                            speed=fleet.speed[racing], progress=fleet.progress[racing],
+                            x=fleet.x[racing], y=fleet.y[racing], on_road=fleet.on_road[racing])
+
+    def write_batches(self):
+        # Writer thread: one batch per full chunk, then the chunk goes back to its ring
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            ring, slot, count = item
+            rows = ring.chunks[slot, :count]
+            self.file.write(TELEMETRY_BATCH.pack(ring.stream, count))
+            for name in rows.dtype.names:
+                self.file.write(np.ascontiguousarray(rows[name]).tobytes())
+            ring.free.put(slot)
+
+    def close(self):
+        if self.file.closed:
+            return
+        # Partial chunks go out as they are; nothing is recorded after this, so there is no need for a free slot
+        for ring in self.rings:
+            if ring.count:
+                self.pending.put((ring, ring.slot, ring.count))
+                ring.count = 0
+        self.pending.put(None)
+        self.writer.join()
+        self.file.close()
+
+class Telemetry:
+    # Reader: every stream as a dict of column arrays, batches concatenated in recording order
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            head = f.read(TELEMETRY_HEADER.size)
+            magic, version, num_karts, seed, sim_dt, total_laps = TELEMETRY_HEADER.unpack(head)
+            if magic != TELEMETRY_MAGIC or version != TELEMETRY_VERSION:
+                raise ValueError(f"{path} is not an ASI KART telemetry file (v{TELEMETRY_VERSION})")
+            batches = [[] for _ in TELEMETRY_STREAMS]
+            while True:
+                head = f.read(TELEMETRY_BATCH.size)
+                if len(head) < TELEMETRY_BATCH.size:
+                    break
+                stream, rows = TELEMETRY_BATCH.unpack(head)
+                dtype = TELEMETRY_STREAMS[stream][1]
+                batches[stream].append({name: np.frombuffer(f.read(rows * dtype[name].itemsize), dtype=dtype[name])
+                                        for name in dtype.names})
+        self.num_karts = num_karts
+        self.seed = None if seed < 0 else seed
+        self.sim_dt = sim_dt
+        self.total_laps = total_laps
+        for (name, dtype), parts in zip(TELEMETRY_STREAMS, batches):
+            columns = {field: np.concatenate([p[field] for p in parts]) if parts else np.zeros(0, dtype=dtype[field])
+                       for field in dtype.names}
+            setattr(self, name, columns)
+
+class TextCache:
+    # Rendered text keyed by (font, string, colour), evicting least recently used entries
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            return surf
+        surf = font.render(text, True, color)
+        self.entries[key] = surf
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surf
+
+    def blit_glyphs(self, screen, font, text, color, pos):
+        # Per-character blits for fast-changing strings (the race timer):
+        # each glyph is rasterised once, so a new time costs only blits
+        x, y = pos
+        for ch in text:
+            glyph = self.render(font, ch, color)
+            screen.blit(glyph, (x, y))
+            x += glyph.get_width()
+
+def format_time(t):
+    m = int(t // 60)
+    s = int(t % 60)
+    ms = int((t * 100) % 100)
+    return f"{m:02d}:{s:02d}.{ms:02d}"
+
 class Game:
-    def __init__(self):
+    def __init__(self, record_dir=None, replay_path=None, track_path=None, telemetry_dir=None):
+        # Only the subsystems the game uses; audio and joysticks stay uninitialised
+        pygame.display.init()
+        pygame.font.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Super Kart Racing")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.Font(None, 40)
         self.title_font = pygame.font.Font(None, 80)
         self.small_font = pygame.font.Font(None, 28)
+        self.text = TextCache()
+        self.profiler = FrameProfiler()
+        self.governor = QualityGovernor()
+        self.particles = ParticleSystem()
+        self.views = {}
+
+        # Static panels, built once
+        self.hud_panel = pygame.Surface((220, 120), pygame.SRCALPHA)
+        pygame.draw.rect(self.hud_panel, (0, 0, 0, 150), (0, 0, 220, 120), border_radius=10)
+        self.results_panel = pygame.Surface((400, SCREEN_HEIGHT))
+        self.results_panel.set_alpha(220)
+        self.results_panel.fill(BLACK)
         self.state = GameState.MENU
         self.total_laps = 3
-        self.track = Track()
-        self.reset_game()
-        
+        self.num_ai = 3
+        self.track_path = track_path or DEFAULT_TRACK
+        self.track = None
+        self.sim = None
+        self.record_dir = record_dir
+        self.recorder = None
+        self.telemetry_dir = telemetry_dir
+        # Race assets are warmed a slice per menu frame; anything that needs them drains the rest first
+        self.loader = self.load_assets()
+        if replay_path:
+            self.start_replay(replay_path)
+
+    def load_assets(self):
+        if self.track is None:
+            path = self.track_path
+            self.track = load_track(path if os.path.isfile(path) else DEFAULT_TRACK)
+            yield
+        self.track.build_tiles()
+        yield
+        probe = Kart(0, 0, PLAYER_COLOR)
+        for scale in sorted({level['scale'] for level in QUALITY_LEVELS}, reverse=True):
+            self.track.tiles_at(scale)
+            self.view_surface(scale)
+            yield
+            for color in [PLAYER_COLOR] + AI_COLORS:
+                KART_SPRITES.kart(color, probe.width, probe.height, 0, scale)
+                yield
+            KART_SPRITES.shadow(probe.width, probe.height, 0, scale)
+
+    def step_loading(self, budget=LOAD_BUDGET):
+        # Run warm-up steps until this frame's budget is spent
+        deadline = time.perf_counter() + budget
+        while self.loader and time.perf_counter() < deadline:
+            try:
+                next(self.loader)
+            except StopIteration:
+                self.loader = None
+
+    def finish_loading(self):
+        self.step_loading(budget=float('inf'))
+
     def reset_game(self):
-        start_cp = self.track.centerline[0]
-        next_cp = self.track.centerline[1]
-        
-        angle = math.degrees(math.atan2(next_cp[0] - start_cp[0], -(next_cp[1] - start_cp[1])))
-        
-        self.player = Kart(start_cp[0] - 30, start_cp[1], (220, 20, 60), is_player=True)
-        self.player.angle = angle
-        
-        waypoints = self.track.centerline
-        self.ai_karts = [
-            AIKart(start_cp[0] + 30, start_cp[1], (30, 144, 255), waypoints),
-            AIKart(start_cp[0] - 30, start_cp[1] + 60, (255, 140, 0), waypoints),
-            AIKart(start_cp[0] + 30, start_cp[1] + 60, (128, 0, 128), waypoints)
-        ]
-        for ai in self.ai_karts: ai.angle = angle
-        
-        self.all_karts = [self.player] + self.ai_karts
-        self.game_time = 0
-        
-    def check_checkpoints(self, kart):
-        # Don't check if already finished
-        if kart.finished: return
+        self.finish_loading()
+        self.stop_recording()
+        self.stop_telemetry()
+        # Explicit seed so a recorded race can name the lane offsets it used
+        seed = random.randrange(2**31)
+        self.sim = RaceSimulation(self.track, self.total_laps, num_ai=self.num_ai, seed=seed,
+                                  profiler=self.profiler)
+        self.player = self.sim.player
+        self.ai_karts = self.sim.ai_karts
+        self.all_karts = self.sim.all_karts
+        self.accumulator = 0.0
+        self.particles.clear()
+        if self.telemetry_dir:
+            os.makedirs(self.telemetry_dir, exist_ok=True)
+            name = time.strftime("race_%Y%m%d-%H%M%S") + f"_{seed}.asitel"
+            self.sim.telemetry = TelemetryRecorder(os.path.join(self.telemetry_dir, name), self.sim)
 
-        next_idx = (kart.last_checkpoint + 1) % len(self.track.checkpoints)
-        cp_data = self.track.checkpoints[next_idx]
-        cp_pos = cp_data['center']
-        
-        dist = math.sqrt((kart.x - cp_pos[0])**2 + (kart.y - cp_pos[1])**2)
-        
-        if dist < 200:
-            kart.last_checkpoint = next_idx
-            if next_idx == 0:
-                kart.current_lap += 1
-                if kart.current_lap > self.total_laps:
-                    kart.finished = True
-                    # Record time immediately
-                    kart.finish_time = self.game_time
-    
-    def update_positions(self):
-        def get_score(k):
-            if k.finished:
-                # Finished karts are ranked by time (lower is better, so negative time)
-                return 99999999 - k.finish_time
-            
-            # Unfinished karts ranked by distance
-            next_idx = (k.last_checkpoint + 1) % len(self.track.checkpoints)
-            next_cp = self.track.checkpoints[next_idx]['center']
-            dist = math.sqrt((k.x - next_cp[0])**2 + (k.y - next_cp[1])**2)
-            return (k.current_lap * 100000) + (k.last_checkpoint * 1000) - dist
-            
-        sorted_karts = sorted(self.all_karts, key=get_score, reverse=True)
-        for i, k in enumerate(sorted_karts):
-            k.position = i + 1
+    def record_tick(self):
+        # Recording starts with the first simulated tick of a race
+        if self.recorder is None:
+            os.makedirs(self.record_dir, exist_ok=True)
+            name = time.strftime("race_%Y%m%d-%H%M%S") + f"_{self.sim.seed}.asirep"
+            self.recorder = ReplayRecorder(os.path.join(self.record_dir, name), self.sim)
+        self.recorder.record(self.sim.game_time)
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def stop_telemetry(self):
+        if self.sim and self.sim.telemetry:
+            self.sim.telemetry.close()
+
+    def start_replay(self, path):
+        self.finish_loading()
+        self.particles.clear()
+        self.replay = Replay(path)
+        # Display-only karts posed from the replay each frame
+        self.replay_fleet = KartFleet()
+        self.replay_karts = [Kart(0, 0, color, is_player, fleet=self.replay_fleet)
+                             for color, is_player in zip(self.replay.colors, self.replay.is_player)]
+        self.replay_time = 0.0
+        self.replay_paused = False
+        self.replay_follow = self.replay.is_player.index(True) if True in self.replay.is_player else 0
+        self.state = GameState.REPLAY
+
+    def replay_frame(self, dt):
+        if not self.replay_paused:
+            self.replay_time += dt
+        tick = self.replay.tick_at(self.replay_time)
+        race_time = self.replay.apply(tick, self.replay_fleet)
+
+        follow = self.replay_karts[self.replay_follow]
+        poses = [(k.x, k.y, k.angle) for k in self.replay_karts]
+        self.draw_world(self.replay_karts, poses, follow.x, follow.y)
+
+        self.screen.blit(self.hud_panel, (20, 20))
+        label = "PAUSED" if self.replay_paused else "REPLAY"
+        self.screen.blit(self.text.render(self.font, label, (255, 80, 0)), (35, 30))
+        self.screen.blit(self.text.render(self.font, f"LAP: {max(follow.current_lap, 1)}/{self.replay.total_laps}", WHITE), (35, 65))
+        self.text.blit_glyphs(self.screen, self.font, format_time(race_time), WHITE, (35, 100))
+        hint = self.text.render(self.small_font, "[SPACE] Pause  [LEFT/RIGHT] Seek  [TAB] Next Kart", (150, 150, 150))
+        self.screen.blit(hint, (SCREEN_WIDTH//2 - hint.get_width()//2, SCREEN_HEIGHT - 40))
 
     def draw_menu(self):
         self.screen.fill(UI_BG)
@@ -459,39 +2355,33 @@ class Game:
         pygame.draw.rect(self.screen, WHITE, (0, 110, SCREEN_WIDTH, 5))
         pygame.draw.rect(self.screen, WHITE, (0, 185, SCREEN_WIDTH, 5))
         
-        title = self.title_font.render("SUPER KART RACING", True, WHITE)
+        title = self.text.render(self.title_font, "SUPER KART RACING", WHITE)
         self.screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 120))
         
-        sub = self.font.render("LAVA EDITION", True, (255, 80, 0))
+        sub = self.text.render(self.font, "LAVA EDITION", (255, 80, 0))
         self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, 220))
         
-        hint = self.font.render("PRESS [SPACE] TO START", True, (0, 255, 0))
+        hint = self.text.render(self.font, "PRESS [SPACE] TO START", (0, 255, 0))
         self.screen.blit(hint, (SCREEN_WIDTH//2 - hint.get_width()//2, 500))
 
     def draw_results_overlay(self):
         # Draw a semi-transparent dark panel on the left side
-        panel = pygame.Surface((400, SCREEN_HEIGHT))
-        panel.set_alpha(220)
-        panel.fill(BLACK)
-        self.screen.blit(panel, (0, 0))
+        self.screen.blit(self.results_panel, (0, 0))
         
         txt = "VICTORY!" if self.player.position == 1 else "FINISHED!"
         col = (255, 215, 0) if self.player.position == 1 else WHITE
         
-        title = self.title_font.render(txt, True, col)
+        title = self.text.render(self.title_font, txt, col)
         self.screen.blit(title, (200 - title.get_width()//2, 50))
         
-        # Leaderboard
-        sorted_karts = sorted(self.all_karts, key=lambda k: k.finish_time if k.finished else 999999)
+        # Leaderboard (the fleet keeps karts in finishing/race order already)
+        sorted_karts = self.sim.fleet.ranked()
         
         for i, k in enumerate(sorted_karts):
             name = "PLAYER" if k.is_player else f"CPU {i+1}"
             
             if k.finished:
-                m = int(k.finish_time // 60)
-                s = int(k.finish_time % 60)
-                ms = int((k.finish_time * 100) % 100)
-                t_str = f"{m:02d}:{s:02d}.{ms:02d}"
+                t_str = format_time(k.finish_time)
             else:
                 t_str = "DRIVING..."
                 
@@ -503,19 +2393,127 @@ class Game:
             row_txt = f"{i+1}. {name}"
             time_txt = t_str
             
-            r1 = self.font.render(row_txt, True, color)
-            r2 = self.font.render(time_txt, True, WHITE)
+            r1 = self.text.render(self.font, row_txt, color)
+            r2 = self.text.render(self.font, time_txt, WHITE)
             
             self.screen.blit(r1, (20, 150 + i * 60))
             self.screen.blit(r2, (220, 150 + i * 60))
             
-        hint = self.small_font.render("Press [SPACE] to Restart", True, (150, 150, 150))
+        hint = self.text.render(self.small_font, "Press [SPACE] to Restart", (150, 150, 150))
         self.screen.blit(hint, (200 - hint.get_width()//2, 600))
 
+    def play_frame(self, keys, dt):
+        # One PLAYING frame: as many fixed sim ticks as real time calls for,
+        # then world and HUD drawing interpolated between the last two ticks
+        self.accumulator += min(dt, MAX_FRAME_DT)
+        while self.accumulator >= SIM_DT:
+            self.sim.fleet.snapshot()
+            self.sim.step(keys, SIM_DT)
+            if self.record_dir:
+                self.record_tick()
+            self.emit_effects()
+            self.particles.update()
+            self.accumulator -= SIM_DT
+
+        xs, ys, angles = self.sim.fleet.interpolate(self.accumulator / SIM_DT)
+        poses = [(xs[k.idx], ys[k.idx], angles[k.idx]) for k in self.all_karts]
+        
+        # Drawing
+        player_x, player_y, _ = poses[0]
+        self.draw_world(self.all_karts, poses, player_x, player_y)
+        
+        # Draw UI
+        if not self.player.finished:
+            self.draw_hud()
+        else:
+            # Results Overlay (Game continues in background)
+            self.draw_results_overlay()
+        self.profiler.mark('hud')
+
+    def emit_effects(self):
+        # Visual-only emitters for the tick just simulated; nothing here feeds back into the race
+        particles = self.particles
+        track = self.track
+        fleet = self.sim.fleet
+
+        # Ambient effects only for hazards near the camera
+        px, py = self.player.x, self.player.y
+        for h in track.hazards:
+            if abs(h['x'] - px) > SCREEN_WIDTH or abs(h['y'] - py) > SCREEN_HEIGHT:
+                continue
+            if h['type'] == 'lava':
+                particles.emit('ember', h['x'], h['y'], EMBERS_PER_TICK, radius=h['radius'] * 0.8)
+            else:
+                particles.emit('splash', h['x'], h['y'], SPLASH_PER_TICK, radius=h['radius'] * 0.8)
+
+        # Tyre smoke behind karts driving off-road
+        off = ~fleet.finished & (np.abs(fleet.speed) > 2) & \
+              ((track.surface_at_many(fleet.x, fleet.y) & SURFACE_ROAD) == 0)
+        for i in np.nonzero(off)[0]:
+            rad = math.radians(fleet.angle[i])
+            particles.emit('smoke', fleet.x[i] - 18 * math.sin(rad), fleet.y[i] + 18 * math.cos(rad),
+                           SMOKE_PER_TICK, radius=6)
+
+        for i, x, y, surface in self.sim.hazard_hits:
+            particles.emit('ember' if surface & SURFACE_LAVA else 'splash', x, y, HIT_PARTICLES, radius=10)
+            particles.emit('burst', fleet.x[i], fleet.y[i], RESPAWN_PARTICLES)
+
+    def view_surface(self, scale):
+        # World layers render here; below full resolution it's an offscreen buffer scaled up afterwards
+        if scale == 1:
+            return self.screen
+        view = self.views.get(scale)
+        if view is None:
+            view = self.views[scale] = pygame.Surface((int(SCREEN_WIDTH * scale), int(SCREEN_HEIGHT * scale))).convert()
+        return view
+
+    def draw_world(self, karts, poses, focus_x, focus_y):
+        # Track and karts centred on the focus point, at the governor's current quality
+        quality = self.governor.settings
+        scale = quality['scale']
+        view = self.view_surface(scale)
+        cam_x = int(focus_x * scale - view.get_width() // 2)
+        cam_y = int(focus_y * scale - view.get_height() // 2)
+
+        self.track.draw(view, cam_x, cam_y, scale)
+        self.profiler.mark('track')
+
+        if quality['particles']:
+            self.particles.draw(view, cam_x, cam_y, scale)
+        self.profiler.mark('particles')
+
+        # Draw shadows
+        if quality['shadows']:
+            for k, pose in zip(karts, poses):
+                k.draw_shadow(view, cam_x, cam_y, pose, scale)
+        self.profiler.mark('shadows')
+
+        # Draw Karts
+        for k, pose in sorted(zip(karts, poses), key=lambda kp: kp[1][1]):
+            k.draw(view, cam_x, cam_y, pose, scale)
+        if view is not self.screen:
+            pygame.transform.scale(view, (SCREEN_WIDTH, SCREEN_HEIGHT), self.screen)
+        self.profiler.mark('karts')
+
+    def draw_hud(self):
+        # Standard Race HUD
+        self.screen.blit(self.hud_panel, (20, 20))
+        
+        pos_color = (255, 215, 0) if self.player.position == 1 else WHITE
+        t1 = self.text.render(self.font, f"POS: {self.player.position}/{len(self.all_karts)}", pos_color)
+        t2 = self.text.render(self.font, f"LAP: {max(self.player.current_lap, 1)}/{self.total_laps}", WHITE)
+        
+        self.screen.blit(t1, (35, 30))
+        self.screen.blit(t2, (35, 65))
+        self.text.blit_glyphs(self.screen, self.font, format_time(self.sim.game_time), WHITE, (35, 100))
+
     def run(self):
         running = True
         while running:
-            dt = self.clock.tick(FPS) / 1000.0
+            dt = self.clock.tick(RENDER_FPS) / 1000.0
+            if self.state != GameState.MENU:
+                self.governor.update(self.clock.get_rawtime())
+            self.profiler.begin_frame()
             
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -530,89 +2528,55 @@ class Game:
                             self.reset_game()
                     if event.key == pygame.K_r and self.state == GameState.PLAYING:
                         self.reset_game()
+                    if self.state == GameState.REPLAY:
+                        if event.key == pygame.K_SPACE:
+                            self.replay_paused = not self.replay_paused
+                        if event.key == pygame.K_LEFT:
+                            self.replay_time = max(0.0, self.replay_time - REPLAY_SEEK)
+                        if event.key == pygame.K_RIGHT:
+                            self.replay_time = min(len(self.replay) * self.replay.sim_dt, self.replay_time + REPLAY_SEEK)
+                        if event.key == pygame.K_TAB:
+                            self.replay_follow = (self.replay_follow + 1) % len(self.replay_karts)
+                    if event.key == pygame.K_F3:
+                        self.profiler.toggle()
+                    if event.key == pygame.K_F4:
+                        self.profiler.write_trace(TRACE_FILE)
             
             if self.state == GameState.MENU:
                 self.draw_menu()
+                self.profiler.mark('menu')
+                self.step_loading()
+                self.profiler.mark('loading')
                 
             elif self.state == GameState.PLAYING:
-                # Timer only stops for UI display, logic tracks individual finish times
-                if not self.player.finished:
-                    self.game_time += dt
-                else:
-                    # If player finished, we still increment a background timer for AI
-                    self.game_time += dt
-
                 keys = pygame.key.get_pressed()
-                
-                # Update ALL karts (Player brakes if finished, AI keeps going)
-                self.player.update(keys, self.track)
-                
-                # Check hazards for player
-                if not self.player.finished:
-                    for haz in self.track.hazards:
-                        dist = math.sqrt((self.player.x - haz['x'])**2 + (self.player.y - haz['y'])**2)
-                        if dist < haz['radius'] * 0.8:
-                            self.player.respawn(self.track.checkpoints)
-
-                # Update AI
-                for ai in self.ai_karts:
-                    ai.update(None, self.track, self.all_karts)
-                    if not ai.finished:
-                        for haz in self.track.hazards:
-                            dist = math.sqrt((ai.x - haz['x'])**2 + (ai.y - haz['y'])**2)
-                            if dist < haz['radius'] * 0.8:
-                                ai.respawn(self.track.checkpoints)
-                
-                # Check Checkpoints & Laps
-                for k in self.all_karts:
-                    self.check_checkpoints(k)
-                
-                self.update_positions()
-                
-                # Drawing
-                cam_x = int(self.player.x - SCREEN_WIDTH // 2)
-                cam_y = int(self.player.y - SCREEN_HEIGHT // 2)
-                
-                self.track.draw(self.screen, cam_x, cam_y)
-                
-                # Draw shadows
-                for k in self.all_karts:
-                    shadow = pygame.Surface((k.width, k.height), pygame.SRCALPHA)
-                    pygame.draw.rect(shadow, (0,0,0,100), (0,0,k.width, k.height), border_radius=5)
-                    rot_shadow = pygame.transform.rotate(shadow, -k.angle)
-                    s_rect = rot_shadow.get_rect(center=(int(k.x - cam_x + 5), int(k.y - cam_y + 5)))
-                    self.screen.blit(rot_shadow, s_rect)
-
-                # Draw Karts
-                for k in sorted(self.all_karts, key=lambda x: x.y):
-                    k.draw(self.screen, cam_x, cam_y)
-                
-                # Draw UI
-                if not self.player.finished:
-                    # Standard Race HUD
-                    hud_surface = pygame.Surface((220, 120), pygame.SRCALPHA)
-                    pygame.draw.rect(hud_surface, (0, 0, 0, 150), (0, 0, 220, 120), border_radius=10)
-                    self.screen.blit(hud_surface, (20, 20))
-                    
-                    pos_color = (255, 215, 0) if self.player.position == 1 else WHITE
-                    t1 = self.font.render(f"POS: {self.player.position}/4", True, pos_color)
-                    t2 = self.font.render(f"LAP: {self.player.current_lap}/{self.total_laps}", True, WHITE)
-                    
-                    mins = int(self.game_time // 60)
-                    secs = int(self.game_time % 60)
-                    ms = int((self.game_time * 100) % 100)
-                    t3 = self.font.render(f"{mins:02d}:{secs:02d}.{ms:02d}", True, WHITE)
-                    
-                    self.screen.blit(t1, (35, 30))
-                    self.screen.blit(t2, (35, 65))
-                    self.screen.blit(t3, (35, 100))
-                else:
-                    # Results Overlay (Game continues in background)
-                    self.draw_results_overlay()
+                self.profiler.mark('input')
+                self.play_frame(keys, dt)
+
+            elif self.state == GameState.REPLAY:
+                self.replay_frame(dt)
+
+            if self.profiler.enabled:
+                self.profiler.draw(self.screen, self.small_font)
+                self.profiler.mark('overlay')
                 
             pygame.display.flip()
+            self.profiler.mark('flip')
+            self.profiler.end_frame()
+        self.stop_recording()
+        self.stop_telemetry()
         pygame.quit()
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="ASI KART")
+    parser.add_argument('--record', nargs='?', const=REPLAY_DIR, metavar='DIR',
+                        help=f"record every race to a replay file (default dir: {REPLAY_DIR})")
+    parser.add_argument('--replay', metavar='FILE', help="play back a recorded race")
+    parser.add_argument('--track', metavar='FILE', help="track file to race on (default: tracks/lava_loop.json)")
+    parser.add_argument('--telemetry', nargs='?', const=TELEMETRY_DIR, metavar='DIR',
+                        help=f"write splits, laps, respawns and speed samples of every race (default dir: {TELEMETRY_DIR})")
+    args = parser.parse_args()
+
+    game = Game(record_dir=args.record, replay_path=args.replay, track_path=args.track,
+                telemetry_dir=args.telemetry)
     game.run()
@@ -0,0 +1,613 @@
+import os
+# Keep the JSON stats on stdout clean
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import struct
+import sys
+import time
+import zlib
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from main import (
+    DEFAULT_TRACK, FPS, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, LINE_LOOKAHEAD, LINE_LOOKAHEAD_GAIN,
+    MAX_FRAME_DT, RENDER_FPS, SCREEN_HEIGHT, SCREEN_WIDTH, SIM_DT, WHITE, Kart, KartFleet, RaceSimulation,
+    TextCache, Track, format_time, input_bits, load_track,
+)
+
+# Wire format: UDP datagrams, little-endian, each starting with NET_HEADER
+NET_MAGIC = b'AK'
+NET_VERSION = 2
+NET_HEADER = struct.Struct('<2sB')        # magic, message type
+MSG_HELLO = 1                             # client -> server: join
+MSG_WELCOME = 2                           # server -> client: slot, race setup, how the layout is split
+MSG_INPUT = 3                             # client -> server: controls, newest snapshot decoded
+MSG_SNAPSHOT = 4                          # server -> client: kart state, delta against an acked snapshot
+MSG_LAYOUT_REQUEST = 5                    # client -> server: layout parts still missing
+MSG_LAYOUT_PART = 6                       # server -> client: one part of the layout
+HELLO = struct.Struct('<B')               # protocol version
+WELCOME = struct.Struct('<BBBB')          # slot (SPECTATOR if none free), karts, laps, ticks per snapshot
+WELCOME_KART = struct.Struct('<BBBB')     # r, g, b, is_player; then WELCOME_LAYOUT
+WELCOME_LAYOUT = struct.Struct('<32sH')   # SHA-256 of the compressed layout, number of parts
+LAYOUT_REQUEST = struct.Struct('<H')      # part count, then that many LAYOUT_INDEX
+LAYOUT_INDEX = struct.Struct('<H')        # part index; a LAYOUT_PART datagram is this plus the part's bytes
+INPUT = struct.Struct('<IiB')             # input sequence, acked snapshot tick (-1: none), INPUT_* bits
+SNAPSHOT = struct.Struct('<IiB')          # tick, base tick (-1: full state), race state
+SPECTATOR = 255
+
+RACE_WAITING = 0
+RACE_RUNNING = 1
+RACE_OVER = 2
+
+# Kart fields carried in snapshots and their fixed-point scale
+NET_FIELDS = [
+    ('x', 16),
+    ('y', 16),
+    ('angle', 64),
+    ('speed', 64),
+    ('current_lap', 1),
+    ('last_checkpoint', 1),
+    ('position', 1),
+    ('finished', 1),
+    ('finish_time', 100),
+    ('invincible_timer', 1),
+]
+MASK_BYTES = (len(NET_FIELDS) + 7) // 8  # per kart: which fields changed against the base
+
+NET_PORT = 40404
+SNAPSHOT_RATE = 20  # snapshots per second; the server still simulates at FPS
+SNAPSHOT_HISTORY = 64  # snapshots either side keeps as possible delta bases
+INTERP_SNAPSHOTS = 2.5  # clients draw this many snapshot intervals behind the newest one
+HELLO_RETRY = 0.5  # seconds between join attempts
+JOIN_TIMEOUT = 60.0  # seconds a client waits to join, and a server waits for its player slots to fill
+LAYOUT_PART = 1200  # bytes of zlib-compressed track layout per datagram, under a typical MTU
+LAYOUT_BURST = 64  # parts a client asks for at a time
+INPUT_MASK = INPUT_UP | INPUT_DOWN | INPUT_LEFT | INPUT_RIGHT  # controls bits a client may set
+CLIENT_TIMEOUT = 5.0  # seconds of silence before a player's controls are released
+LINGER = 1.0  # seconds the server keeps sending the final state after the race
+
+def quantise(fleet):
+    # Kart state as one row of fixed-point integers per kart
+    q = np.empty((len(fleet), len(NET_FIELDS)), dtype=np.int64)
+    for i, (name, scale) in enumerate(NET_FIELDS):
+        values = getattr(fleet, name)
+        if name == 'angle':
+            values = values % 360
+        q[:, i] = np.round(values * scale)
+    return q
+
+def dequantise(q, fleet):
+    for i, (name, scale) in enumerate(NET_FIELDS):
+        arr = getattr(fleet, name)
+        arr[:] = q[:, i] / scale if scale != 1 else q[:, i]
+
+def encode_varints(values):
+    # LEB128 over a whole array at once: 7 bits per byte, high bit set on all but the last byte
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 63, 7):
+        nbytes += values >= (1 << shift)
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max()) if len(values) else 0):
+        m = nbytes > k
+        more = (nbytes[m] > k + 1).astype(np.int64) << 7
+        out[starts[m] + k] = ((values[m] >> (7 * k)) & 0x7f) | more
+    return out.tobytes()
+
+def decode_varints(data, count):
+    b = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    last = (b & 0x80) == 0
+    ends = np.nonzero(last)[0]
+    if len(ends) != count or (count and ends[-1] != len(b) - 1):
+        raise ValueError("malformed varint stream")
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+    value_of = np.concatenate([[0], np.cumsum(last[:-1])]).astype(np.int64)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shift = 7 * (np.arange(len(b)) - starts[value_of])
+    values = np.zeros(count, dtype=np.int64)
+    np.add.at(values, value_of, (b & 0x7f) << shift)
+    return values
+
+def encode_snapshot(tick, base_tick, state, q, base_q):
+    # Changed fields only, as zigzagged deltas against the base (zeros for a full snapshot)
+    delta = q - base_q
+    zigzag = (delta << 1) ^ (delta >> 63)
+    changed = zigzag != 0
+    masks = np.packbits(changed, axis=1, bitorder='little')
+    return (NET_HEADER.pack(NET_MAGIC, MSG_SNAPSHOT) + SNAPSHOT.pack(tick, base_tick, state)
+            + masks.tobytes() + encode_varints(zigzag[changed]))
+
+def decode_snapshot(body, num_karts, bases):
+    # bases: tick -> quantised state this side still has; returns None if the base is gone
+    tick, base_tick, state = SNAPSHOT.unpack_from(body)
+    if base_tick < 0:
+        base_q = np.zeros((num_karts, len(NET_FIELDS)), dtype=np.int64)
+    elif base_tick in bases:
+        base_q = bases[base_tick]
+    else:
+        return None
+    offset = SNAPSHOT.size
+    raw = np.frombuffer(body, dtype=np.uint8, count=num_karts * MASK_BYTES, offset=offset)
+    changed = np.unpackbits(raw.reshape(num_karts, MASK_BYTES), axis=1, bitorder='little')
+    changed = changed[:, :len(NET_FIELDS)].astype(bool)
+    zigzag = decode_varints(body[offset + raw.size:], int(changed.sum()))
+    delta = np.zeros(base_q.shape, dtype=np.int64)
+    delta[changed] = (zigzag >> 1) ^ -(zigzag & 1)
+    return tick, state, base_q + delta
+
+def message(kind, payload=b''):
+    return NET_HEADER.pack(NET_MAGIC, kind) + payload
+
+class RemotePlayer:
+    def __init__(self, slot):
+        self.slot = slot
+        self.acked = -1
+        self.input_seq = -1
+        self.last_heard = time.monotonic()
+        self.bytes_sent = 0
+        self.snapshots_sent = 0
+
+class RaceServer(asyncio.DatagramProtocol):
+    # Authoritative race: the sim runs here at FPS, clients only send controls.
+    # Each client gets snapshots delta-encoded against the newest snapshot it acknowledged.
+    def __init__(self, sim, layout, snapshot_rate=SNAPSHOT_RATE):
+        self.sim = sim
+        # The layout goes out compressed and in parts: a big track does not fit in one datagram
+        data = zlib.compress(json.dumps(layout).encode())
+        self.layout_parts = [data[i:i + LAYOUT_PART] for i in range(0, len(data), LAYOUT_PART)]
+        self.layout_digest = hashlib.sha256(data).digest()
+        self.snapshot_every = max(1, round(FPS / snapshot_rate))
+        self.clients = {}
+        self.free_slots = [k.idx for k in sim.players]
+        self.history = OrderedDict()
+        self.transport = None
+        self.state = RACE_RUNNING if not self.free_slots else RACE_WAITING
+        self.tick_ms = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < NET_HEADER.size:
+            return
+        magic, kind = NET_HEADER.unpack_from(data)
+        if magic != NET_MAGIC:
+            return
+        body = data[NET_HEADER.size:]
+        if kind == MSG_HELLO and len(body) >= HELLO.size and HELLO.unpack_from(body)[0] == NET_VERSION:
+            self.welcome(addr)
+        elif kind == MSG_INPUT and addr in self.clients and len(body) >= INPUT.size:
+            client = self.clients[addr]
+            seq, acked, controls = INPUT.unpack_from(body)
+            client.last_heard = time.monotonic()
+            if seq <= client.input_seq:
+                return  # late or duplicate datagram
+            client.input_seq = seq
+            client.acked = max(client.acked, acked)
+            if client.slot != SPECTATOR and self.state == RACE_RUNNING:
+                self.sim.fleet.controls[client.slot] = controls & INPUT_MASK
+        elif kind == MSG_LAYOUT_REQUEST and addr in self.clients and len(body) >= LAYOUT_REQUEST.size:
+            count = min(LAYOUT_REQUEST.unpack_from(body)[0], LAYOUT_BURST,
+                        (len(body) - LAYOUT_REQUEST.size) // LAYOUT_INDEX.size)
+            for i in struct.unpack_from(f'<{count}H', body, LAYOUT_REQUEST.size):
+                if i < len(self.layout_parts):
+                    self.transport.sendto(message(MSG_LAYOUT_PART, LAYOUT_INDEX.pack(i) + self.layout_parts[i]), addr)
+
+    def welcome(self, addr):
+        # Repeated HELLOs (lost WELCOME) get the same slot back
+        client = self.clients.get(addr)
+        if client is None:
+            client = self.clients[addr] = RemotePlayer(self.free_slots.pop(0) if self.free_slots else SPECTATOR)
+            if self.state == RACE_WAITING and not self.free_slots:
+                self.state = RACE_RUNNING
+        fleet = self.sim.fleet
+        payload = WELCOME.pack(client.slot, len(fleet), self.sim.total_laps, self.snapshot_every)
+        for k in fleet.karts:
+            payload += WELCOME_KART.pack(*k.color, int(k.is_player))
+        payload += WELCOME_LAYOUT.pack(self.layout_digest, len(self.layout_parts))
+        self.transport.sendto(message(MSG_WELCOME, payload), addr)
+
+    def release_silent(self):
+        now = time.monotonic()
+        for client in self.clients.values():
+            if client.slot != SPECTATOR and now - client.last_heard > CLIENT_TIMEOUT:
+                self.sim.fleet.controls[client.slot] = 0
+
+    def send_snapshots(self):
+        q = quantise(self.sim.fleet)
+        tick = self.sim.tick
+        self.history[tick] = q
+        while len(self.history) > SNAPSHOT_HISTORY:
+            self.history.popitem(last=False)
+
+        # Clients acked on the same tick share one encoding
+        encoded = {}
+        for addr, client in self.clients.items():
+            base = client.acked if client.acked in self.history and client.acked != tick else -1
+            if base not in encoded:
+                base_q = self.history[base] if base >= 0 else np.zeros_like(q)
+                encoded[base] = encode_snapshot(tick, base, self.state, q, base_q)
+            self.transport.sendto(encoded[base], addr)
+            client.bytes_sent += len(encoded[base])
+            client.snapshots_sent += 1
+
+    async def run(self, max_time=600, join_timeout=JOIN_TIMEOUT):
+        # Fixed-rate loop; ticks the sim while racing, snapshots every few ticks regardless.
+        # If the player slots are not all taken within join_timeout, the race is called off
+        loop = asyncio.get_running_loop()
+        next_tick = started = loop.time()
+        frame = 0
+        over_at = None
+        while over_at is None or loop.time() - over_at < LINGER:
+            t0 = time.perf_counter()
+            if self.state == RACE_WAITING and loop.time() - started >= join_timeout:
+                self.state = RACE_OVER
+                over_at = loop.time()
+            if self.state == RACE_RUNNING:
+                self.sim.step(None, SIM_DT)
+                if self.sim.all_finished() or self.sim.game_time >= max_time:
+                    self.state = RACE_OVER
+                    over_at = loop.time()
+            if frame % self.snapshot_every == 0:
+                self.release_silent()
+                self.send_snapshots()
+            self.tick_ms.append((time.perf_counter() - t0) * 1000)
+            frame += 1
+
+            next_tick += SIM_DT
+            delay = next_tick - loop.time()
+            if delay < -MAX_FRAME_DT:
+                next_tick = loop.time()  # too far behind: drop ticks rather than burst
+            await asyncio.sleep(max(0.0, delay))
+        return self.stats()
+
+    def stats(self):
+        ticks = sorted(self.tick_ms) or [0.0]
+        elapsed = max(self.sim.game_time, SIM_DT)
+        return {
+            'started': self.sim.tick > 0,
+            'race': self.sim.results(),
+            'tick_ms_p50': ticks[len(ticks) // 2],
+            'tick_ms_p99': ticks[min(len(ticks) - 1, int(len(ticks) * 0.99))],
+            'clients': [
+                {
+                    'slot': c.slot,
+                    'snapshots': c.snapshots_sent,
+                    'bytes_per_snapshot': c.bytes_sent / max(1, c.snapshots_sent),
+                    'bytes_per_sec': c.bytes_sent / elapsed,
+                }
+                for c in self.clients.values()
+            ],
+        }
+
+class RaceClient(asyncio.DatagramProtocol):
+    # Joins a server, sends controls and keeps decoded snapshots for delta bases and interpolation
+    def __init__(self):
+        self.transport = None
+        self.slot = None
+        self.track = None
+        self.fleet = None
+        self.karts = []
+        self.total_laps = 0
+        self.snapshot_dt = SIM_DT
+        self.bases = OrderedDict()
+        self.buffer = deque(maxlen=16)
+        self.latest = -1
+        self.state = RACE_WAITING
+        self.clock_offset = None
+        self.input_seq = 0
+        self.bytes_received = 0
+        self.welcome = None  # (slot, laps, ticks per snapshot) until the layout is complete
+        self.layout_digest = None
+        self.layout_parts = []
+        self.joined = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        asyncio.get_running_loop().create_task(self.join())
+
+    async def join(self):
+        # HELLO until welcomed, then ask for the layout parts still missing until the track is built
+        while self.slot is None:
+            if self.welcome is None:
+                self.transport.sendto(message(MSG_HELLO, HELLO.pack(NET_VERSION)))
+            else:
+                self.request_layout()
+            await asyncio.sleep(HELLO_RETRY)
+
+    def request_layout(self):
+        missing = [i for i, part in enumerate(self.layout_parts) if part is None][:LAYOUT_BURST]
+        payload = LAYOUT_REQUEST.pack(len(missing)) + struct.pack(f'<{len(missing)}H', *missing)
+        self.transport.sendto(message(MSG_LAYOUT_REQUEST, payload))
+
+    def datagram_received(self, data, addr):
+        self.bytes_received += len(data)
+        if len(data) < NET_HEADER.size:
+            return
+        magic, kind = NET_HEADER.unpack_from(data)
+        if magic != NET_MAGIC:
+            return
+        body = data[NET_HEADER.size:]
+        if kind == MSG_WELCOME and self.welcome is None:
+            self.setup(body)
+        elif kind == MSG_LAYOUT_PART and self.welcome is not None and self.slot is None:
+            self.receive_layout(body)
+        elif kind == MSG_SNAPSHOT and self.slot is not None:
+            self.receive(body)
+
+    def setup(self, body):
+        slot, num_karts, laps, every = WELCOME.unpack_from(body)
+        offset = WELCOME.size
+        self.fleet = KartFleet()
+        for _ in range(num_karts):
+            r, g, b, is_player = WELCOME_KART.unpack_from(body, offset)
+            offset += WELCOME_KART.size
+            self.karts.append(Kart(0, 0, (r, g, b), bool(is_player), fleet=self.fleet))
+        self.layout_digest, parts = WELCOME_LAYOUT.unpack_from(body, offset)
+        self.layout_parts = [None] * parts
+        self.welcome = (slot, laps, every)
+        self.request_layout()
+
+    def receive_layout(self, body):
+        if len(body) < LAYOUT_INDEX.size:
+            return
+        i = LAYOUT_INDEX.unpack_from(body)[0]
+        if i >= len(self.layout_parts) or self.layout_parts[i] is not None:
+            return
+        self.layout_parts[i] = body[LAYOUT_INDEX.size:]
+        received = sum(part is not None for part in self.layout_parts)
+        if received < len(self.layout_parts):
+            if received % LAYOUT_BURST == 0:
+                self.request_layout()  # a burst's worth is in: ask for the next without waiting for the retry
+            return
+        data = b''.join(self.layout_parts)
+        if hashlib.sha256(data).digest() != self.layout_digest:
+            self.layout_parts = [None] * len(self.layout_parts)  # corrupted: fetch it again
+            return
+        self.track = Track(json.loads(zlib.decompress(data)))
+        slot, laps, every = self.welcome
+        self.total_laps = laps
+        self.snapshot_dt = every * SIM_DT
+        self.slot = slot
+        self.joined.set()
+
+    def receive(self, body):
+        try:
+            decoded = decode_snapshot(body, len(self.karts), self.bases)
+        except (ValueError, struct.error):
+            return
+        if decoded is None:
+            return
+        tick, state, q = decoded
+        if tick <= self.latest and state == self.state:
+            return  # out of order
+        self.state = state
+        self.latest = max(self.latest, tick)
+        self.bases[tick] = q
+        while len(self.bases) > SNAPSHOT_HISTORY:
+            self.bases.popitem(last=False)
+        if not self.buffer or tick > self.buffer[-1][0]:
+            self.buffer.append((tick, q))
+        # Server clock estimate: delay only ever makes a snapshot look older, so the largest offset seen
+        # (the least delayed snapshot) is kept, decaying slowly so a clock that drifts back is followed
+        offset = tick * SIM_DT - time.monotonic()
+        self.clock_offset = offset if self.clock_offset is None else max(offset, self.clock_offset - 0.001)
+
+    def send_input(self, controls):
+        self.input_seq += 1
+        self.transport.sendto(message(MSG_INPUT, INPUT.pack(self.input_seq, self.latest, controls)))
+
+    def pose(self):
+        # Poses the display karts a little behind the newest snapshot, interpolating between the two around it
+        if not self.buffer:
+            return False
+        t = (time.monotonic() + self.clock_offset - INTERP_SNAPSHOTS * self.snapshot_dt) / SIM_DT
+        older = newer = self.buffer[-1]
+        for i in range(len(self.buffer) - 1, 0, -1):
+            if self.buffer[i - 1][0] <= t:
+                older, newer = self.buffer[i - 1], self.buffer[i]
+                break
+        dequantise(older[1], self.fleet)
+        self.fleet.snapshot()
+        dequantise(newer[1], self.fleet)
+        span = newer[0] - older[0]
+        alpha = min(1.0, max(0.0, (t - older[0]) / span)) if span else 1.0
+        x, y, angle = self.fleet.interpolate(alpha)
+        self.fleet.x, self.fleet.y, self.fleet.angle = x.copy(), y.copy(), angle.copy()
+        return True
+
+    def own_kart(self):
+        return self.karts[self.slot] if self.slot != SPECTATOR else self.karts[0]
+
+class BotClient(RaceClient):
+    # Headless player that drives its kart along the track's racing line using only snapshot data
+    def controls(self):
+        if self.slot in (None, SPECTATOR) or not self.buffer:
+            return 0
+        _, q = self.buffer[-1]
+        x, y = q[self.slot, 0] / 16, q[self.slot, 1] / 16
+        angle = q[self.slot, 2] / 64
+        speed = q[self.slot, 3] / 64
+        line = self.track.racing_line
+        here = int(np.argmin((line['x'] - x)**2 + (line['y'] - y)**2))
+        arc = line['arc']
+        ahead = int(np.searchsorted(arc, (arc[here] + LINE_LOOKAHEAD + abs(speed) * LINE_LOOKAHEAD_GAIN) % arc[-1], side='right')) - 1
+        target = math.degrees(math.atan2(line['x'][ahead] - x, -(line['y'][ahead] - y)))
+        diff = (target - angle + 180) % 360 - 180
+
+        bits = 0
+        if speed < line['speed'][here] and abs(diff) < 60:
+            bits |= INPUT_UP
+        elif speed > line['speed'][here] + 1:
+            bits |= INPUT_DOWN
+        if diff < -3:
+            bits |= INPUT_LEFT
+        elif diff > 3:
+            bits |= INPUT_RIGHT
+        return bits
+
+async def open_client(host, port, cls=RaceClient, timeout=JOIN_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    _, client = await loop.create_datagram_endpoint(cls, remote_addr=(host, port))
+    try:
+        await asyncio.wait_for(client.joined.wait(), timeout)
+    except asyncio.TimeoutError:
+        client.transport.close()
+        raise ConnectionError(f"could not join the race at {host}:{port} within {timeout:g}s") from None
+    return client
+
+async def drive_bots(host, port, count, max_time, join_timeout=JOIN_TIMEOUT):
+    bots = [await open_client(host, port, BotClient, join_timeout) for _ in range(count)]
+    start = time.monotonic()
+    while time.monotonic() - start < max_time and not all(b.state == RACE_OVER for b in bots):
+        for bot in bots:
+            bot.send_input(bot.controls())
+        await asyncio.sleep(SIM_DT)
+    elapsed = time.monotonic() - start
+    report = []
+    for bot in bots:
+        kart = bot.karts[bot.slot] if bot.slot != SPECTATOR else None
+        if kart is not None and bot.buffer:
+            dequantise(bot.buffer[-1][1], bot.fleet)
+        report.append({
+            'slot': bot.slot,
+            'lap': kart.current_lap if kart else None,
+            'finished': kart.finished if kart else None,
+            'finish_time': kart.finish_time if kart and kart.finished else None,
+            'bytes_received_per_sec': bot.bytes_received / elapsed,
+        })
+        bot.transport.close()
+    return report
+
+def make_race(args):
+    path = args.track or DEFAULT_TRACK
+    track = load_track(path if os.path.isfile(path) else DEFAULT_TRACK)
+    sim = RaceSimulation(track, args.laps, num_ai=args.ai, num_players=args.players, seed=args.seed)
+    return sim, track.layout
+
+async def serve(args, bots=0):
+    sim, layout = make_race(args)
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: RaceServer(sim, layout, args.snapshot_rate), local_addr=(args.host, args.port))
+    try:
+        if bots:
+            port = transport.get_extra_info('sockname')[1]
+            bot_task = loop.create_task(drive_bots('127.0.0.1', port, bots, args.max_time + 10, args.join_timeout))
+            stats = await server.run(args.max_time, args.join_timeout)
+            try:
+                stats['bots'] = await bot_task
+            except ConnectionError as e:
+                stats['bots'] = str(e)
+        else:
+            stats = await server.run(args.max_time, args.join_timeout)
+    finally:
+        transport.close()
+    return stats
+
+async def play(args):
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Super Kart Racing - Online")
+    font = pygame.font.Font(None, 40)
+    text = TextCache()
+    client = await open_client(args.host, args.port)
+
+    running = True
+    while running:
+        frame_start = time.monotonic()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+        if client.slot != SPECTATOR:
+            client.send_input(input_bits(pygame.key.get_pressed()))
+
+        if client.pose():
+            me = client.own_kart()
+            cam_x = int(me.x - SCREEN_WIDTH // 2)
+            cam_y = int(me.y - SCREEN_HEIGHT // 2)
+            client.track.draw(screen, cam_x, cam_y)
+            for k in client.karts:
+                k.draw_shadow(screen, cam_x, cam_y)
+            for k in sorted(client.karts, key=lambda k: k.y):
+                k.draw(screen, cam_x, cam_y)
+            if client.state == RACE_WAITING:
+                status = "WAITING FOR PLAYERS"
+            elif me.finished:
+                status = f"FINISHED P{me.position} {format_time(me.finish_time)}"
+            else:
+                status = f"POS {me.position}/{len(client.karts)}  LAP {max(me.current_lap, 1)}/{client.total_laps}"
+            screen.blit(text.render(font, status, WHITE), (35, 30))
+        pygame.display.flip()
+
+        # Frame pacing without blocking the network handlers
+        await asyncio.sleep(max(0.0, 1.0 / RENDER_FPS - (time.monotonic() - frame_start)))
+    client.transport.close()
+    pygame.quit()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Networked races: authoritative server, window client, bots.")
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    def race_options(p):
+        p.add_argument('--port', type=int, default=NET_PORT)
+        p.add_argument('--players', type=int, default=2, help="human/bot slots; the race starts once all are taken")
+        p.add_argument('--ai', type=int, default=2, help="server-driven AI karts")
+        p.add_argument('--laps', type=int, default=3)
+        p.add_argument('--seed', type=int, default=None)
+        p.add_argument('--track', help="track file (default: tracks/lava_loop.json)")
+        p.add_argument('--snapshot-rate', type=float, default=SNAPSHOT_RATE, help="snapshots per second")
+        p.add_argument('--max-time', type=float, default=600, help="race seconds before the server calls it")
+        p.add_argument('--join-timeout', type=float, default=JOIN_TIMEOUT,
+                       help="seconds to wait for every player slot to be taken before giving up")
+
+    server = sub.add_parser('server', help="run an authoritative race server")
+    server.add_argument('--host', default='0.0.0.0')
+    race_options(server)
+
+    local = sub.add_parser('local', help="server plus bot clients on localhost; prints stats")
+    local.set_defaults(host='127.0.0.1')
+    race_options(local)
+
+    bots = sub.add_parser('bots', help="connect bot clients to a server")
+    bots.add_argument('--host', default='127.0.0.1')
+    bots.add_argument('--port', type=int, default=NET_PORT)
+    bots.add_argument('--count', type=int, default=1)
+    bots.add_argument('--max-time', type=float, default=600)
+    bots.add_argument('--join-timeout', type=float, default=JOIN_TIMEOUT)
+
+    client = sub.add_parser('client', help="join a server in a window")
+    client.add_argument('--host', default='127.0.0.1')
+    client.add_argument('--port', type=int, default=NET_PORT)
+
+    args = parser.parse_args(argv)
+    try:
+        if args.mode in ('server', 'local'):
+            if args.mode == 'local':
+                args.port = 0 if args.port == NET_PORT else args.port
+            stats = asyncio.run(serve(args, bots=args.players if args.mode == 'local' else 0))
+            print(json.dumps(stats), flush=True)
+            if not stats['started']:
+                print(f"not every player joined within {args.join_timeout:g}s", file=sys.stderr)
+                return 1
+        elif args.mode == 'bots':
+            print(json.dumps(asyncio.run(drive_bots(args.host, args.port, args.count, args.max_time,
+                                                    args.join_timeout))), flush=True)
+        else:
+            asyncio.run(play(args))
+    except ConnectionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
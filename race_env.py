@@ -0,0 +1,222 @@
+import os
+# Headless: training runs never open a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from main import (
+    DEFAULT_TRACK, HAZARD_HIT_SCALE, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, KART_FIELDS, Kart, KartFleet,
+    PLAYER_COLORS, RaceSimulation, SIM_DT, SURFACE_HAZARD, SURFACE_LAVA, SURFACE_ROAD, SURFACE_WATER,
+    load_track,
+)
+
+# Actions are INPUT_* bitmasks (up/down/left/right), so a discrete policy picks one of ACTIONS
+ACTIONS = 16
+
+# Observation: one float32 row per kart, columns in OBS_FIELDS order.
+# Directions are in the kart's frame: forward along its heading, right 90 degrees clockwise.
+ENV_HAZARDS = 2  # nearest hazards per observation
+HAZARD_RANGE = 600.0  # px; empty or further hazard slots read (HAZARD_RANGE, 0, 0)
+OBS_FIELDS = [
+    'x', 'y', 'heading_sin', 'heading_cos', 'speed',
+    'on_road', 'water', 'lava',
+    'checkpoint_dist', 'checkpoint_forward', 'checkpoint_right',
+] + [f'hazard{i}_{f}' for i in range(ENV_HAZARDS) for f in ('forward', 'right', 'radius')]
+
+# Rewards
+REWARD_PER_PX = 0.01  # per px of race progress; driving backwards costs the same
+RESPAWN_PENALTY = 5.0  # on top of the progress lost by going back to the last checkpoint
+MAX_STEPS = 60 * 180  # ticks before an episode is truncated
+
+def observe(fleet, sel, track):
+    # OBS_FIELDS rows for the selected karts, straight from the fleet arrays
+    x = fleet.x[sel]
+    y = fleet.y[sel]
+    rad = np.radians(fleet.angle[sel])
+    fwd_x, fwd_y = np.sin(rad), -np.cos(rad)
+    obs = np.empty((len(sel), len(OBS_FIELDS)), dtype=np.float32)
+    obs[:, 0] = x
+    obs[:, 1] = y
+    obs[:, 2] = fwd_x
+    obs[:, 3] = -fwd_y
+    obs[:, 4] = fleet.speed[sel]
+
+    surface = track.surface_at_many(x, y)
+    obs[:, 5] = (surface & SURFACE_ROAD) != 0
+    obs[:, 6] = (surface & SURFACE_WATER) != 0
+    obs[:, 7] = (surface & SURFACE_LAVA) != 0
+
+    # Next checkpoint: distance, then unit direction in the kart's frame
+    cp = track.checkpoint_xy[(fleet.last_checkpoint[sel] + 1) % len(track.checkpoint_xy)]
+    dx = cp[:, 0] - x
+    dy = cp[:, 1] - y
+    dist = np.hypot(dx, dy)
+    obs[:, 8] = dist
+    obs[:, 9] = (dx * fwd_x + dy * fwd_y) / np.maximum(dist, 1e-9)
+    obs[:, 10] = (dx * -fwd_y + dy * fwd_x) / np.maximum(dist, 1e-9)
+
+    # Nearest hazards by centre distance: offset in the kart's frame and hit radius
+    slots = obs[:, 11:].reshape(len(sel), ENV_HAZARDS, 3)
+    slots[:] = (HAZARD_RANGE, 0, 0)
+    if len(track.hazard_xy):
+        hx = track.hazard_xy[:, 0] - x[:, None]
+        hy = track.hazard_xy[:, 1] - y[:, None]
+        nearest = np.argsort(np.hypot(hx, hy), axis=1)[:, :ENV_HAZARDS]
+        hx = np.take_along_axis(hx, nearest, axis=1)
+        hy = np.take_along_axis(hy, nearest, axis=1)
+        seen = np.hypot(hx, hy) < HAZARD_RANGE
+        k = nearest.shape[1]
+        slots[:, :k, 0] = np.where(seen, hx * fwd_x[:, None] + hy * fwd_y[:, None], HAZARD_RANGE)
+        slots[:, :k, 1] = np.where(seen, hx * -fwd_y[:, None] + hy * fwd_x[:, None], 0)
+        slots[:, :k, 2] = np.where(seen, track.hazard_radius[nearest] * HAZARD_HIT_SCALE, 0)
+    return obs
+
+class RaceEnv:
+    # One race through RaceSimulation: the policy drives the player kart against num_ai AI karts.
+    # reset() -> (obs, info); step(action) -> (obs, reward, terminated, truncated, info)
+    def __init__(self, track=None, num_ai=3, total_laps=3, max_steps=MAX_STEPS, seed=None):
+        self.track = track or load_track(DEFAULT_TRACK)
+        self.num_ai = num_ai
+        self.total_laps = total_laps
+        self.max_steps = max_steps
+        self.rng = random.Random(seed)
+        self.sim = None
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng.seed(seed)
+        self.sim = RaceSimulation(self.track, self.total_laps, num_ai=self.num_ai, seed=self.rng.randrange(2**31))
+        self.sim.update_positions()
+        self.last_progress = self.sim.player.progress
+        return self.observe(), self.info()
+
+    def step(self, action):
+        sim = self.sim
+        player = sim.player
+        sim.fleet.controls[player.idx] = action
+        sim.step()
+
+        hit = any(i == player.idx for i, _, _, _ in sim.hazard_hits)
+        reward = (player.progress - self.last_progress) * REWARD_PER_PX - hit * RESPAWN_PENALTY
+        self.last_progress = player.progress
+        terminated = bool(player.finished)
+        truncated = not terminated and sim.tick >= self.max_steps
+        return self.observe(), float(reward), terminated, truncated, self.info()
+
+    def observe(self):
+        return observe(self.sim.fleet, np.array([self.sim.player.idx]), self.track)[0]
+
+    def info(self):
+        player = self.sim.player
+        return {'lap': player.current_lap, 'position': player.position, 'respawns': player.respawns,
+                'finish_time': player.finish_time if player.finished else None}
+
+class VecRaceEnv:
+    # num_envs independent single-kart races in one KartFleet, all stepped by the same array ops.
+    # Finished or truncated races restart in place; their last observation is info['final_obs'].
+    def __init__(self, track=None, num_envs=64, total_laps=3, max_steps=MAX_STEPS):
+        self.track = track or load_track(DEFAULT_TRACK)
+        self.num_envs = num_envs
+        self.total_laps = total_laps
+        self.max_steps = max_steps
+
+        # Every race starts from pole on the same grid
+        x, y, angle, seg = RaceSimulation.grid_slot(self.track, 0)
+        self.fleet = KartFleet()
+        for _ in range(num_envs):
+            kart = Kart(x, y, PLAYER_COLORS[0], is_player=True, fleet=self.fleet)
+            kart.angle = angle
+            kart.seg_hint = seg
+        self.start = {name: getattr(self.fleet, name).copy() for name in KART_FIELDS}
+
+        self.all = np.arange(num_envs)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.last_progress = np.zeros(num_envs)
+
+    def reset(self):
+        self.restart(self.all)
+        return observe(self.fleet, self.all, self.track), {}
+
+    def restart(self, envs):
+        for name, values in self.start.items():
+            getattr(self.fleet, name)[envs] = values[envs]
+        self.steps[envs] = 0
+        self.fleet.update_progress(self.track)
+        self.last_progress[envs] = self.fleet.progress[envs]
+
+    def step(self, actions):
+        # actions: one INPUT_* bitmask per env
+        fleet = self.fleet
+        track = self.track
+        fleet.controls[:] = actions
+        fleet.update(self.all, None, track)
+        self.steps += 1
+
+        # Same hazard rule as RaceSimulation.check_hazards
+        hit = ((track.surface_at_many(fleet.x, fleet.y) & SURFACE_HAZARD) != 0) & ~fleet.finished & \
+              (fleet.invincible_timer == 0)
+        fleet.respawn(np.nonzero(hit)[0], track.checkpoints)
+        fleet.check_checkpoints(track.checkpoint_xy, self.total_laps, self.steps * SIM_DT)
+        fleet.update_progress(track)
+
+        reward = (fleet.progress - self.last_progress) * REWARD_PER_PX - hit * RESPAWN_PENALTY
+        self.last_progress[:] = fleet.progress
+        terminated = fleet.finished.copy()
+        truncated = ~terminated & (self.steps >= self.max_steps)
+        obs = observe(fleet, self.all, track)
+        info = {'lap': fleet.current_lap.copy(), 'respawns': fleet.respawns.copy(),
+                'finish_time': np.where(terminated, fleet.finish_time, np.nan)}
+
+        done = np.nonzero(terminated | truncated)[0]
+        if len(done):
+            info['final_obs'] = obs.copy()
+            self.restart(done)
+            obs[done] = observe(fleet, done, track)
+        return obs, reward.astype(np.float32), terminated, truncated, info
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step the vectorised race env with a scripted checkpoint-chasing policy; prints JSON throughput.")
+    parser.add_argument('--envs', type=int, default=256)
+    parser.add_argument('--steps', type=int, default=2000, help="vector steps to run")
+    parser.add_argument('--laps', type=int, default=1)
+    parser.add_argument('--track', default=DEFAULT_TRACK)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    env = VecRaceEnv(load_track(args.track), args.envs, args.laps)
+    rng = np.random.default_rng(args.seed)
+    right = OBS_FIELDS.index('checkpoint_right')
+    obs, _ = env.reset()
+    total_reward = 0.0
+    finishes = []
+    t0 = time.perf_counter()
+    for _ in range(args.steps):
+        # Full throttle at the next checkpoint, with some random steering so the races spread out
+        bearing = obs[:, right] + rng.normal(0, 0.5, args.envs)
+        actions = INPUT_UP | np.where(bearing > 0.1, INPUT_RIGHT, np.where(bearing < -0.1, INPUT_LEFT, 0))
+        obs, reward, terminated, _, info = env.step(actions)
+        total_reward += float(reward.sum())
+        finishes.extend(info['finish_time'][terminated].tolist())
+    elapsed = time.perf_counter() - t0
+
+    env_steps = args.envs * args.steps
+    print(json.dumps({
+        'envs': args.envs,
+        'env_steps': env_steps,
+        'env_steps_per_sec': env_steps / elapsed,
+        'env_steps_per_hour': env_steps / elapsed * 3600,
+        'mean_reward_per_step': total_reward / env_steps,
+        'finishes': len(finishes),
+        'mean_finish_time': sum(finishes) / len(finishes) if finishes else None,
+    }, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import os
+# Keep worker stdout clean for the JSON result stream
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import itertools
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import DEFAULT_TRACK, RaceSimulation, TelemetryRecorder, load_track
+
+# CLI option -> AIKart attribute it overrides
+PARAM_ATTRS = {
+    'max_speed': ('base_max_speed', 'current_max_speed'),
+    'turn_speed': ('turn_speed',),
+}
+
+# Tracks are baked once per worker process and reused across its races
+_tracks = {}
+
+def get_track(path, layout):
+    key = json.dumps([path, layout], sort_keys=True)
+    if key not in _tracks:
+        # Track files go through the baked geometry cache; overrides get their own entry
+        _tracks[key] = load_track(path or DEFAULT_TRACK, layout)
+    return _tracks[key]
+
+def run_race(spec):
+    # Runs in a worker: one headless AI-vs-AI race
+    ai_params = {}
+    for name, value in spec['params'].items():
+        for attr in PARAM_ATTRS[name]:
+            ai_params[attr] = value
+
+    sim = RaceSimulation(get_track(spec['track'], spec['layout']), spec['laps'], num_ai=spec['karts'],
+                         with_player=False, seed=spec['seed'], ai_params=ai_params)
+    if spec['telemetry']:
+        sim.telemetry = TelemetryRecorder(spec['telemetry'], sim)
+    result = sim.run(spec['max_time'])
+    if sim.telemetry:
+        sim.telemetry.close()
+    result['race'] = spec['race']
+    result['params'] = spec['params']
+    result['layout'] = spec['layout']
+    result['telemetry'] = spec['telemetry']
+    return result
+
+def parse_values(text, cast=float):
+    return [cast(v) for v in text.split(',')] if text else []
+
+def build_specs(args):
+    # One spec per (parameter combination x repeat), each with its own seed
+    sweep = {}
+    if args.max_speed:
+        sweep['max_speed'] = parse_values(args.max_speed)
+    if args.turn_speed:
+        sweep['turn_speed'] = parse_values(args.turn_speed)
+    layouts = [{'track_width': w} for w in parse_values(args.track_width, int)] or [{}]
+
+    names = list(sweep)
+    combos = list(itertools.product(*(sweep[n] for n in names)))
+    specs = []
+    race = 0
+    for layout in layouts:
+        for combo in combos:
+            for _ in range(args.races):
+                specs.append({
+                    'race': race,
+                    'seed': args.seed + race,
+                    'params': dict(zip(names, combo)),
+                    'track': args.track,
+                    'layout': layout,
+                    'karts': args.karts,
+                    'laps': args.laps,
+                    'max_time': args.max_time,
+                    'telemetry': os.path.join(args.telemetry, f"race_{race:05d}.asitel") if args.telemetry else None,
+                })
+                race += 1
+    return specs
+
+class Summary:
+    # Running aggregate per (params, layout) group
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, result):
+        key = json.dumps({'params': result['params'], 'layout': result['layout']}, sort_keys=True)
+        g = self.groups.setdefault(key, {
+            'races': 0, 'entries': 0, 'finishers': 0, 'dnf': 0, 'respawns': 0,
+            'finish_time_total': 0.0, 'best_time': None, 'wins_by_slot': {},
+        })
+        g['races'] += 1
+        for slot, k in enumerate(result['karts']):
+            g['entries'] += 1
+            g['respawns'] += k['respawns']
+            if not k['finished']:
+                g['dnf'] += 1
+                continue
+            g['finishers'] += 1
+            g['finish_time_total'] += k['finish_time']
+            if g['best_time'] is None or k['finish_time'] < g['best_time']:
+                g['best_time'] = k['finish_time']
+            if k['position'] == 1:
+                g['wins_by_slot'][slot] = g['wins_by_slot'].get(slot, 0) + 1
+
+    def report(self):
+        out = []
+        for key, g in self.groups.items():
+            entry = json.loads(key)
+            entry.update({
+                'races': g['races'],
+                'mean_finish_time': g['finish_time_total'] / g['finishers'] if g['finishers'] else None,
+                'best_time': g['best_time'],
+                'dnf': g['dnf'],
+                'mean_respawns': g['respawns'] / g['entries'] if g['entries'] else 0,
+                'wins_by_slot': g['wins_by_slot'],
+            })
+            out.append(entry)
+        return out
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless AI-vs-AI races across worker processes.")
+    parser.add_argument('--races', type=int, default=10, help="races per parameter combination")
+    parser.add_argument('--karts', type=int, default=4, help="AI karts per race")
+    parser.add_argument('--laps', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first race; race i uses seed + i")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--max-time', type=float, default=600, help="simulated seconds before a race is called")
+    parser.add_argument('--max-speed', help="comma-separated AI base_max_speed values to sweep")
+    parser.add_argument('--turn-speed', help="comma-separated AI turn_speed values to sweep")
+    parser.add_argument('--track', help="track file (default: tracks/lava_loop.json)")
+    parser.add_argument('--track-width', help="comma-separated track half-widths to sweep")
+    parser.add_argument('--telemetry', metavar='DIR', help="write each race's telemetry to DIR/race_NNNNN.asitel")
+    args = parser.parse_args(argv)
+    if args.telemetry:
+        os.makedirs(args.telemetry, exist_ok=True)
+
+    specs = build_specs(args)
+    summary = Summary()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_race, spec) for spec in specs]
+        # Stream each race as soon as it finishes
+        for future in as_completed(futures):
+            result = future.result()
+            summary.add(result)
+            print(json.dumps(result), flush=True)
+
+    print(json.dumps({'summary': summary.report()}), flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())